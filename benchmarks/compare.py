@@ -0,0 +1,37 @@
+import argparse
+import json
+
+def compare(baseline, candidate):
+    """Yield (name, baseline median, candidate median, change) for every benchmark in either file"""
+    names = sorted(set(baseline['benchmarks']) | set(candidate['benchmarks']))
+    for name in names:
+        old = baseline['benchmarks'].get(name, {}).get('median')
+        new = candidate['benchmarks'].get(name, {}).get('median')
+        change = (new - old) / old if old and new is not None else None
+        yield name, old, new, change
+
+def _format_seconds(value):
+    return f"{value:.4f}s" if value is not None else "-"
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding='utf-8') as f:
+        candidate = json.load(f)
+
+    corpus_keys = ('scale', 'seed', 'video_bytes', 'files')
+    if any(baseline['corpus'].get(key) != candidate['corpus'].get(key) for key in corpus_keys):
+        print("Warning: the two runs used different corpora\n")
+
+    print(f"{'benchmark':<26} {'baseline':>10} {'candidate':>10} {'change':>8}")
+    for name, old, new, change in compare(baseline, candidate):
+        change_text = f"{change:+.1%}" if change is not None else "-"
+        print(f"{name:<26} {_format_seconds(old):>10} {_format_seconds(new):>10} {change_text:>8}")
+
+if __name__ == '__main__':
+    main()
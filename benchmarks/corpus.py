@@ -0,0 +1,242 @@
+from heif_reader import register_heif_opener_once
+from datetime import datetime, timedelta
+from PIL import Image
+import argparse
+import struct
+import random
+import piexif
+import json
+import os
+
+# Capture locations; files are scattered a couple of kilometres around each one
+CITIES = [
+    ('New York', 40.7128, -74.0060),
+    ('Los Angeles', 34.0522, -118.2437),
+    ('Chicago', 41.8781, -87.6298),
+    ('Seattle', 47.6062, -122.3321),
+    ('Miami', 25.7617, -80.1918),
+    ('Denver', 39.7392, -104.9903),
+    ('London', 51.5074, -0.1278),
+    ('Paris', 48.8566, 2.3522),
+    ('Berlin', 52.5200, 13.4050),
+    ('Rome', 41.9028, 12.4964),
+    ('Tokyo', 35.6762, 139.6503),
+    ('Sydney', -33.8688, 151.2093),
+    ('Rio de Janeiro', -22.9068, -43.1729),
+    ('Cape Town', -33.9249, 18.4241),
+    ('Mexico City', 19.4326, -99.1332),
+    ('Toronto', 43.6532, -79.3832),
+]
+
+# Files of each kind generated per unit of scale
+CORPUS_MIX = {
+    'jpeg_gps': 40,
+    'jpeg_date': 20,
+    'jpeg_bare': 10,
+    'heic_gps': 20,
+    'heic_bare': 5,
+    'mp4_gps': 10,
+    'mov_gps': 5,
+    'mp4_bare': 5,
+    'unsupported': 10,
+    'duplicate': 10,
+}
+
+IMAGE_SIZES = [(640, 480), (480, 640), (800, 600)]
+VIDEO_BYTES = 2 * 1024 * 1024
+QUICKTIME_EPOCH = datetime(1904, 1, 1)
+START_DATE = datetime(2015, 1, 1)
+LOCATION_KEY = b'com.apple.quicktime.location.ISO6709'
+
+def generate_corpus(root, scale=1, seed=0, video_bytes=VIDEO_BYTES):
+    """Write a reproducible media library into root and return its manifest.
+
+    The same scale and seed always produce the same files, names and
+    modification times. The manifest maps each file name to its kind and
+    records the GPS and capture time that were written into it; it is
+    returned rather than written so the folder holds only the corpus.
+    """
+    os.makedirs(root, exist_ok=True)
+    rng = random.Random(seed)
+    heic_supported = True
+    files = {}
+    # Media written so far, by name, with the (gps, capture_time) it carries
+    written = {}
+
+    for kind, count in CORPUS_MIX.items():
+        for index in range(count * scale):
+            gps, capture_time = _pick_location(rng), _pick_time(rng)
+            if kind.endswith('_bare'):
+                gps, capture_time = None, None
+            elif kind == 'jpeg_date':
+                gps = None
+            name = f"{kind}_{index:05d}"
+
+            if kind.startswith('jpeg'):
+                name += '.jpg'
+                _write_jpeg(os.path.join(root, name), rng, gps, capture_time)
+            elif kind.startswith('heic'):
+                if not heic_supported:
+                    continue
+                name += '.heic'
+                try:
+                    _write_heic(os.path.join(root, name), rng, gps, capture_time)
+                except Exception as e:
+                    # pillow_heif wheels without an HEVC encoder cannot write HEIC
+                    print(f"Skipping HEIC files: {e}")
+                    heic_supported = False
+                    continue
+            elif kind.startswith('mp4') or kind.startswith('mov'):
+                name += '.mp4' if kind.startswith('mp4') else '.mov'
+                _write_video(os.path.join(root, name), rng, gps, capture_time, video_bytes,
+                             apple_keys=kind.startswith('mov'), moov_first=index % 2 == 0)
+            elif kind == 'unsupported':
+                name += rng.choice(['.txt', '.pdf', '.bin'])
+                _write_unsupported(os.path.join(root, name), rng)
+            else:
+                if not written:
+                    continue
+                source = rng.choice(sorted(written))
+                stem, extension = os.path.splitext(source)
+                name = f"{stem}_copy{index}{extension}"
+                with open(os.path.join(root, source), 'rb') as src, open(os.path.join(root, name), 'wb') as dst:
+                    dst.write(src.read())
+                gps, capture_time = written[source]
+
+            mtime = (capture_time or _pick_time(rng)).timestamp()
+            os.utime(os.path.join(root, name), (mtime, mtime))
+            if kind == 'unsupported':
+                # The picked time only set the mtime; nothing is written into these files
+                gps, capture_time = None, None
+            files[name] = {'kind': kind, 'gps': gps,
+                           'capture_time': capture_time.isoformat() if capture_time else None}
+            if kind != 'unsupported' and kind != 'duplicate':
+                written[name] = (gps, capture_time)
+
+    return {
+        'scale': scale,
+        'seed': seed,
+        'video_bytes': video_bytes,
+        'heic_supported': heic_supported,
+        'files': files,
+    }
+
+def corpus_paths(root, manifest, *kinds):
+    """Absolute paths of the corpus files whose kind starts with one of the given prefixes"""
+    return [os.path.join(root, name) for name, info in sorted(manifest['files'].items())
+            if not kinds or info['kind'].startswith(kinds)]
+
+def _pick_location(rng):
+    _, lat, lon = rng.choice(CITIES)
+    return round(lat + rng.uniform(-0.02, 0.02), 6), round(lon + rng.uniform(-0.02, 0.02), 6)
+
+def _pick_time(rng):
+    return START_DATE + timedelta(seconds=rng.randrange(10 * 365 * 24 * 3600))
+
+def _exif_bytes(gps, capture_time):
+    exif = {'0th': {piexif.ImageIFD.Make: b'PicPoint', piexif.ImageIFD.Model: b'Benchmark'},
+            'Exif': {}, 'GPS': {}}
+    if capture_time:
+        exif['Exif'][piexif.ExifIFD.DateTimeOriginal] = capture_time.strftime("%Y:%m:%d %H:%M:%S").encode()
+    if gps:
+        lat, lon = gps
+        exif['GPS'] = {
+            piexif.GPSIFD.GPSLatitudeRef: b'N' if lat >= 0 else b'S',
+            piexif.GPSIFD.GPSLatitude: _to_rationals(abs(lat)),
+            piexif.GPSIFD.GPSLongitudeRef: b'E' if lon >= 0 else b'W',
+            piexif.GPSIFD.GPSLongitude: _to_rationals(abs(lon)),
+        }
+    return piexif.dump(exif)
+
+def _to_rationals(degrees):
+    d = int(degrees)
+    m = int((degrees - d) * 60)
+    s = round(((degrees - d) * 60 - m) * 60 * 10000)
+    return ((d, 1), (m, 1), (s, 10000))
+
+def _make_image(rng):
+    width, height = rng.choice(IMAGE_SIZES)
+    image = Image.new('RGB', (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    # A little noise keeps the encoders from producing unrealistically tiny files
+    for _ in range(200):
+        image.putpixel((rng.randrange(width), rng.randrange(height)),
+                       tuple(rng.randrange(256) for _ in range(3)))
+    return image
+
+def _write_jpeg(path, rng, gps, capture_time):
+    image = _make_image(rng)
+    if gps or capture_time:
+        image.save(path, 'JPEG', quality=85, exif=_exif_bytes(gps, capture_time))
+    else:
+        image.save(path, 'JPEG', quality=85)
+
+def _write_heic(path, rng, gps, capture_time):
+    register_heif_opener_once()
+    image = _make_image(rng)
+    if gps or capture_time:
+        image.save(path, 'HEIF', quality=50, exif=_exif_bytes(gps, capture_time))
+    else:
+        image.save(path, 'HEIF', quality=50)
+
+def _box(box_type, payload):
+    return struct.pack('>I', 8 + len(payload)) + box_type + payload
+
+def _full_box(box_type, payload, version=0, flags=0):
+    return _box(box_type, struct.pack('>I', (version << 24) | flags) + payload)
+
+def _iso6709(gps):
+    return f"{gps[0]:+08.4f}{gps[1]:+09.4f}/".encode('ascii')
+
+def _write_video(path, rng, gps, capture_time, video_bytes, apple_keys, moov_first):
+    """Write an MP4/MOV whose moov box carries mvhd/tkhd and, optionally, a location"""
+    seconds = int((capture_time - QUICKTIME_EPOCH).total_seconds()) if capture_time else 0
+    width, height = rng.choice([(1920, 1080), (3840, 2160), (1080, 1920)])
+
+    mvhd = _full_box(b'mvhd', struct.pack('>IIII', seconds, seconds, 600, 6000) + b'\x00' * 80)
+    tkhd = _full_box(b'tkhd', struct.pack('>IIIII', seconds, seconds, 1, 0, 6000) + b'\x00' * 52
+                     + struct.pack('>II', width << 16, height << 16), flags=7)
+    trak = _box(b'trak', tkhd + _box(b'mdia', b'\x00' * 32))
+
+    location = b''
+    if gps and apple_keys:
+        keys = _full_box(b'keys', struct.pack('>I', 1) + _box(b'mdta', LOCATION_KEY))
+        item = _box(struct.pack('>I', 1), _box(b'data', struct.pack('>II', 1, 0) + _iso6709(gps)))
+        hdlr = _full_box(b'hdlr', b'\x00' * 4 + b'mdta' + b'\x00' * 13)
+        # QuickTime's meta box has no version and flags, unlike the ISO one
+        location = _box(b'meta', hdlr + keys + _box(b'ilst', item))
+    elif gps:
+        text = _iso6709(gps)
+        location = _box(b'udta', _box(b'\xa9xyz', struct.pack('>HH', len(text), 0x15c7) + text))
+
+    ftyp = _box(b'ftyp', b'qt  \x00\x00\x02\x00qt  ' if apple_keys else b'isom\x00\x00\x02\x00isommp41')
+    moov = _box(b'moov', mvhd + trak + location)
+    with open(path, 'wb') as f:
+        f.write(ftyp)
+        if moov_first:
+            f.write(moov)
+        f.write(struct.pack('>I', 8 + video_bytes) + b'mdat')
+        f.write(rng.randbytes(video_bytes))
+        if not moov_first:
+            f.write(moov)
+
+def _write_unsupported(path, rng):
+    with open(path, 'wb') as f:
+        f.write(rng.randbytes(rng.randrange(1024, 64 * 1024)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic media library for benchmarking")
+    parser.add_argument('root', help="Folder to write the corpus into")
+    parser.add_argument('--scale', type=int, default=1, help="Multiplier for the number of files")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--video-bytes', type=int, default=VIDEO_BYTES, help="mdat payload size per video")
+    parser.add_argument('--manifest', help="Also write the manifest to this JSON file")
+    args = parser.parse_args()
+
+    manifest = generate_corpus(args.root, args.scale, args.seed, args.video_bytes)
+    if args.manifest:
+        with open(args.manifest, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+    print(f"Wrote {len(manifest['files'])} files to {args.root}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from offline_geocoder import get_gazetteer
+from urllib.parse import urlparse, parse_qs
+import threading
+import random
+import json
+import time
+
+class FakeNominatimServer:
+    """An in-process stand-in for Nominatim's /reverse endpoint, served on localhost.
+
+    Answers come from the bundled gazetteer, so they look like real addresses.
+    Latency, server errors and the server's own rate limit are simulated so the
+    geocoding client's retries and pacing can be exercised without a network.
+    Use it as a context manager.
+    """
+
+    def __init__(self, latency_ms=50, jitter_ms=20, error_rate=0.0, rate_limit_per_second=None, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_per_second = rate_limit_per_second
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), _handler_for(self))
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def decide(self):
+        """Pick the fate of one request: (status, delay in seconds)"""
+        with self.lock:
+            self.requests += 1
+            if self.rate_limit_per_second:
+                now = time.monotonic()
+                if now - self.window_start >= 1:
+                    self.window_start, self.window_count = now, 0
+                self.window_count += 1
+                if self.window_count > self.rate_limit_per_second:
+                    self.rate_limited += 1
+                    return 429, 0
+            delay = max(0.0, self.random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+            if self.random.random() < self.error_rate:
+                self.errors += 1
+                return 503, delay
+            return 200, delay
+
+    def answer(self, lat, lon):
+        gazetteer = get_gazetteer()
+        place = gazetteer.nearest(lat, lon) if gazetteer is not None else None
+        if place is None:
+            return {"error": "Unable to geocode"}
+        return {
+            "lat": str(lat),
+            "lon": str(lon),
+            "address": {
+                "city": place.city,
+                "state": place.state,
+                "country": place.country,
+                "country_code": (place.country_code or '').lower(),
+            },
+        }
+
+def _handler_for(server):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.rstrip('/') != '/reverse':
+                self._send(200, {})
+                return
+            status, delay = server.decide()
+            time.sleep(delay)
+            if status != 200:
+                self._send(status, {"error": "Simulated failure"}, retry_after=1 if status == 429 else None)
+                return
+            query = parse_qs(url.query)
+            try:
+                lat, lon = float(query['lat'][0]), float(query['lon'][0])
+            except (KeyError, ValueError):
+                self._send(400, {"error": "lat and lon are required"})
+                return
+            self._send(200, server.answer(lat, lon))
+
+        def _send(self, status, payload, retry_after=None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            if retry_after is not None:
+                self.send_header('Retry-After', str(retry_after))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
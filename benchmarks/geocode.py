@@ -0,0 +1,143 @@
+from benchmarks.fake_nominatim import FakeNominatimServer
+from geocoder_backends import create_backend, GeocodingError, BACKENDS
+from constants import SELF_HOSTED_RATE_PER_SECOND
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.corpus import CITIES
+from offline_geocoder import get_gazetteer
+from datetime import datetime
+import argparse
+import platform
+import random
+import json
+import math
+import time
+import sys
+
+RESULTS_FORMAT = 1
+# Points are scattered this far around the corpus cities, so each is a distinct lookup
+SPREAD_DEGREES = 0.2
+
+def sample_points(count, seed=0):
+    rng = random.Random(seed)
+    points = []
+    for _ in range(count):
+        _, lat, lon = rng.choice(CITIES)
+        points.append((lat + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+                       lon + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES)))
+    return points
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1)]
+
+def measure(backend, points, concurrency):
+    """Look up every point with `concurrency` lookups in flight; return throughput and latency figures.
+
+    Latency is what the caller sees for one lookup, including rate limiting
+    and retries, which is what decides how long the geocode stage takes.
+    """
+    def timed_lookup(point):
+        start = time.perf_counter()
+        try:
+            place = backend.reverse(*point)
+        except GeocodingError:
+            return time.perf_counter() - start, 'error'
+        return time.perf_counter() - start, 'found' if place else 'empty'
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed_lookup, points))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in outcomes)
+    kinds = [kind for _, kind in outcomes]
+    return {
+        'concurrency': concurrency,
+        'lookups': len(points),
+        'seconds': round(elapsed, 4),
+        'lookups_per_second': round(len(points) / elapsed, 2) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else None,
+        'found': kinds.count('found'),
+        'empty': kinds.count('empty'),
+        'errors': kinds.count('error'),
+    }
+
+def make_backend(name, args, concurrency, fake_server):
+    if name == 'fake':
+        return create_backend('self_hosted', base_url=fake_server.url, rate_per_second=args.rate or 1e6,
+                              concurrency=concurrency, max_retries=args.max_retries)
+    if name == 'offline':
+        return create_backend('offline')
+    kwargs = {'concurrency': concurrency, 'max_retries': args.max_retries}
+    if args.url:
+        kwargs['base_url'] = args.url
+    if args.rate:
+        kwargs['rate_per_second'] = args.rate
+    return create_backend(name, **kwargs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure geocode-stage throughput and tail latency per backend")
+    parser.add_argument('--backends', nargs='+', default=['offline', 'fake'],
+                        choices=sorted(set(BACKENDS) | {'fake'}))
+    parser.add_argument('--points', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16],
+                        help="Lookups in flight; several values sweep them")
+    parser.add_argument('--url', help="Base URL for the nominatim and self_hosted backends")
+    parser.add_argument('--rate', type=float, default=None,
+                        help=f"Client rate limit per second (self_hosted default {SELF_HOSTED_RATE_PER_SECOND:g})")
+    parser.add_argument('--max-retries', type=int, default=3)
+    parser.add_argument('--latency-ms', type=float, default=50, help="Fake server mean latency")
+    parser.add_argument('--jitter-ms', type=float, default=20, help="Fake server latency deviation")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fake server share of 503 answers")
+    parser.add_argument('--server-rate-limit', type=int, default=None,
+                        help="Fake server requests per second before it answers 429")
+    parser.add_argument('--output', help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    points = sample_points(args.points, args.seed)
+    # Loading the gazetteer is a one-off per process; the offline backend and the fake server both use it
+    get_gazetteer()
+    results = []
+    print(f"{'backend':<12} {'conc':>4} {'lookups/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8} {'errors':>6}")
+    with FakeNominatimServer(args.latency_ms, args.jitter_ms, args.error_rate, args.server_rate_limit,
+                             args.seed) as fake_server:
+        for name in args.backends:
+            for concurrency in args.concurrency:
+                backend = make_backend(name, args, concurrency, fake_server)
+                try:
+                    result = measure(backend, points, concurrency)
+                finally:
+                    backend.close()
+                result['backend'] = name
+                results.append(result)
+                print(f"{name:<12} {concurrency:>4} {result['lookups_per_second']:>10} {result['p50_ms']:>8} "
+                      f"{result['p95_ms']:>8} {result['p99_ms']:>8} {result['max_ms']:>8} {result['errors']:>6}")
+
+    if args.output:
+        output = {
+            'format': RESULTS_FORMAT,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'points': args.points,
+            'seed': args.seed,
+            'fake_server': {
+                'latency_ms': args.latency_ms,
+                'jitter_ms': args.jitter_ms,
+                'error_rate': args.error_rate,
+                'rate_limit_per_second': args.server_rate_limit,
+            },
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,266 @@
+from benchmarks.corpus import generate_corpus, corpus_paths, VIDEO_BYTES
+from constants import STATE_MAPPING, COUNTRY_CODES, EXTRACTION_WORKERS
+from typing import Callable, NamedTuple
+from contextlib import contextmanager
+from unittest import mock
+from datetime import datetime
+import subprocess
+import statistics
+import tempfile
+import argparse
+import platform
+import random
+import shutil
+import json
+import time
+import sys
+import os
+
+RESULTS_FORMAT = 1
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+US_SVG_PATH = os.path.join(REPO_ROOT, 'assets', 'us_map.svg')
+WORLD_SVG_PATH = os.path.join(REPO_ROOT, 'assets', 'world_map.svg')
+GEOFENCE_COUNT = 5000
+
+class Case(NamedTuple):
+    """One benchmark: how many items a run handles, and a factory for a fresh timed run"""
+    items: int
+    prepare: Callable[[], Callable[[], object]]
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+@benchmark('extract_gps_info_image')
+def _extract_gps_info_image(context):
+    from utils import extract_gps_info_image
+    files = corpus_paths(context.corpus_dir, context.manifest, 'jpeg', 'heic')
+    return Case(len(files), lambda: lambda: [extract_gps_info_image(path) for path in files])
+
+@benchmark('extract_gps_info_video')
+def _extract_gps_info_video(context):
+    from utils import extract_gps_info_video
+    files = corpus_paths(context.corpus_dir, context.manifest, 'mp4', 'mov')
+    return Case(len(files), lambda: lambda: [extract_gps_info_video(path, context.exiftool_pool)
+                                             for path in files])
+
+@benchmark('get_creation_time')
+def _get_creation_time(context):
+    from utils import get_creation_time
+    files = corpus_paths(context.corpus_dir, context.manifest, 'jpeg', 'heic', 'mp4', 'mov')
+    return Case(len(files), lambda: lambda: [get_creation_time(path, context.exiftool_pool)
+                                             for path in files])
+
+@benchmark('reverse_geocode')
+def _reverse_geocode(context):
+    from offline_geocoder import get_gazetteer, reverse_geocode
+    # Loading the gazetteer is a one-off per process and is not part of the timing
+    get_gazetteer()
+    points = [tuple(info['gps']) for info in context.manifest['files'].values() if info['gps']]
+    return Case(len(points), lambda: lambda: [reverse_geocode(lat, lon) for lat, lon in points])
+
+@benchmark('resolve_boundaries')
+def _resolve_boundaries(context):
+    from boundary_resolver import get_boundaries
+    get_boundaries()
+    points = [tuple(info['gps']) for info in context.manifest['files'].values() if info['gps']]
+    return Case(len(points), lambda: lambda: get_boundaries().resolve_many(points))
+
+@benchmark('match_geofences')
+def _match_geofences(context):
+    from geofences import GeofenceIndex, CircleFence, PolygonFence
+    points = [tuple(info['gps']) for info in context.manifest['files'].values() if info['gps']]
+    # Thousands of fences around the photos, so most points have several nearby to test
+    rng = random.Random(0)
+    fences = []
+    for index in range(GEOFENCE_COUNT):
+        lat, lon = rng.choice(points)
+        lat, lon = lat + rng.uniform(-0.05, 0.05), lon + rng.uniform(-0.05, 0.05)
+        if index % 2:
+            fences.append(CircleFence(f"Circle {index}", lat, lon, rng.uniform(50, 2000)))
+        else:
+            size = rng.uniform(0.001, 0.02)
+            fences.append(PolygonFence(f"Polygon {index}", [(lat, lon), (lat + size, lon),
+                                                            (lat + size, lon + size), (lat, lon + size * 2)]))
+    index = GeofenceIndex(fences)
+    return Case(len(points), lambda: lambda: [index.match(lat, lon) for lat, lon in points])
+
+@benchmark('find_duplicates')
+def _find_duplicates(context):
+    from gui import DuplicateFinderThread
+    thread = DuplicateFinderThread(context.corpus_dir)
+    return Case(len(context.manifest['files']), lambda: thread.find_duplicates)
+
+@benchmark('update_svg_maps')
+def _update_svg_maps(context):
+    from workers import MapGenerationThread
+    # Every known region lit up is the worst case for the regex substitutions
+    thread = MapGenerationThread(context.corpus_dir, US_SVG_PATH, WORLD_SVG_PATH)
+    states, countries = sorted(set(STATE_MAPPING.values())), sorted(set(COUNTRY_CODES.values()))
+    return Case(len(states) + len(countries), lambda: lambda: thread.update_svg_maps(states, countries))
+
+@benchmark('sort_by_time')
+def _sort_by_time(context):
+    return _sort_case(context, 'SortByTimeThread', cache=False)
+
+@benchmark('sort_by_time_cached')
+def _sort_by_time_cached(context):
+    return _sort_case(context, 'SortByTimeThread', cache=True)
+
+@benchmark('sort_by_location')
+def _sort_by_location(context):
+    return _sort_case(context, 'SortByLocThread', cache=False)
+
+def _sort_case(context, thread_name, cache):
+    """Sort a fresh copy of the corpus; the copy itself is not timed"""
+    import workers
+    from metadata_cache import MetadataCache
+    from media_record import iter_media_records
+
+    cache_path = os.path.join(context.scratch_dir, f"{thread_name}.sqlite3")
+    if cache:
+        # Warm the cache once so every timed run measures hits
+        warm_cache = MetadataCache(cache_path)
+        list(iter_media_records(corpus_paths(context.corpus_dir, context.manifest),
+                                context.exiftool_pool, context.workers, cache=warm_cache))
+        warm_cache.close()
+
+    def prepare():
+        work_dir = os.path.join(context.scratch_dir, 'sort')
+        shutil.rmtree(work_dir, ignore_errors=True)
+        shutil.copytree(context.corpus_dir, work_dir)
+        thread = getattr(workers, thread_name)(work_dir, exiftool_pool=context.exiftool_pool,
+                                              extraction_workers=context.workers)
+
+        def run():
+            with _offline_workers(cache_path if cache else None):
+                thread.run()
+        return run
+
+    return Case(len(context.manifest['files']), prepare)
+
+@contextmanager
+def _offline_workers(cache_path):
+    """Keep sort runs off the network and away from the user's own caches.
+
+    Locations come from the bundled gazetteer, so the timings measure
+    PicPoint's own work rather than Nominatim's latency. The user's
+    geofences are left out, and no move journals are written, so a run
+    neither prunes the user's journals nor becomes the operation Undo reverses.
+    """
+    import workers
+    import utils
+    from metadata_cache import MetadataCache
+    open_cache = (lambda: MetadataCache(cache_path)) if cache_path else (lambda: None)
+    with mock.patch.object(utils, 'GEOCODER_ONLINE_FALLBACK', False), \
+         mock.patch.object(workers, 'open_metadata_cache', open_cache), \
+         mock.patch.object(workers, 'open_geocode_cache', lambda: None), \
+         mock.patch.object(workers, 'load_geofences', lambda: None), \
+         mock.patch.object(workers, 'open_journal', lambda *args, **kwargs: None):
+        yield
+
+class Context(NamedTuple):
+    corpus_dir: str
+    scratch_dir: str
+    manifest: dict
+    exiftool_pool: object
+    workers: int
+
+def run_benchmark(name, context, repeat):
+    """Time one benchmark, returning its JSON result entry"""
+    try:
+        case = BENCHMARKS[name](context)
+        times = []
+        for _ in range(repeat):
+            target = case.prepare()
+            start = time.perf_counter()
+            target()
+            times.append(time.perf_counter() - start)
+    except Exception as e:
+        return {'error': f"{type(e).__name__}: {e}"}
+
+    median = statistics.median(times)
+    return {
+        'items': case.items,
+        'repeat': repeat,
+        'times': [round(t, 6) for t in times],
+        'min': round(min(times), 6),
+        'median': round(median, 6),
+        'mean': round(statistics.mean(times), 6),
+        'items_per_second': round(case.items / median, 2) if median else None,
+    }
+
+def default_corpus_parent():
+    """tmpfs when there is one, so runs measure parsing rather than the disk"""
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the PicPoint benchmarks on a synthetic corpus")
+    parser.add_argument('--output', default='benchmark-results.json', help="Where to write the JSON results")
+    parser.add_argument('--corpus-parent', default=None,
+                        help="Folder to build the corpus in (default: tmpfs if available)")
+    parser.add_argument('--scale', type=int, default=1, help="Multiplier for the number of corpus files")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--video-bytes', type=int, default=VIDEO_BYTES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=EXTRACTION_WORKERS, help="Extraction worker processes")
+    parser.add_argument('--only', nargs='*', choices=sorted(BENCHMARKS), help="Run only these benchmarks")
+    args = parser.parse_args()
+
+    from exiftool_pool import ExifToolPool
+    corpus_parent = args.corpus_parent or default_corpus_parent()
+    scratch_dir = tempfile.mkdtemp(prefix='picpoint-bench-', dir=corpus_parent)
+    corpus_dir = os.path.join(scratch_dir, 'corpus')
+    exiftool_pool = ExifToolPool()
+    try:
+        print(f"Generating corpus in {corpus_dir}...")
+        manifest = generate_corpus(corpus_dir, args.scale, args.seed, args.video_bytes)
+        context = Context(corpus_dir, scratch_dir, manifest, exiftool_pool, args.workers)
+
+        results = {}
+        for name in args.only or BENCHMARKS:
+            results[name] = run_benchmark(name, context, args.repeat)
+            result = results[name]
+            if 'error' in result:
+                print(f"{name:<26} error: {result['error']}")
+            else:
+                print(f"{name:<26} median {result['median']:.4f}s  {result['items_per_second']} items/s")
+    finally:
+        exiftool_pool.shutdown()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    output = {
+        'format': RESULTS_FORMAT,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'corpus': {
+            'scale': args.scale,
+            'seed': args.seed,
+            'video_bytes': args.video_bytes,
+            'files': len(manifest['files']),
+            'heic_supported': manifest['heic_supported'],
+            'location': corpus_parent,
+        },
+        'workers': args.workers,
+        'benchmarks': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,321 @@
+from constants import BOUNDARIES_PATH, STATE_MAPPING
+from offline_geocoder import get_gazetteer, reverse_geocode
+from typing import NamedTuple, Optional
+import threading
+import struct
+import math
+import zlib
+
+BOUNDARIES_MAGIC = b'PPBD'
+BOUNDARIES_VERSION = 1
+COORDINATE_SCALE = 100000
+# Regions are found through their bounding boxes on a coarse grid before any edge is tested
+PREFILTER_DEGREES = 5
+# Points that agree to this many decimals (about 11 m) share one lookup in a batch
+BATCH_PRECISION = 4
+# Cells per degree used to share one answer between neighbouring points in a batch
+CELL_SCALE = 100
+# Coarser rounding for the nearest-town fallback used off the simplified coastlines
+FALLBACK_PRECISION = 2
+# Countries without an outline whose towns fit in this many degrees are treated as enclaves
+ENCLAVE_MAX_DEGREES = 2
+ENCLAVE_MARGIN_DEGREES = 0.05
+
+COUNTRY = 0
+STATE = 1
+
+
+_HEADER = struct.Struct('<4sHI')
+
+_boundaries = None
+_boundaries_loaded = False
+_boundaries_lock = threading.Lock()
+
+class BoundaryMatch(NamedTuple):
+    """Country and, inside the US, state of a point; codes are the SVG map path ids"""
+    country_code: str
+    country: str
+    state_code: Optional[str]
+    state: Optional[str]
+
+class Ring:
+    """One closed polygon ring with its edges bucketed into horizontal slabs"""
+
+    def __init__(self, points):
+        lons = [lon for lon, _ in points]
+        lats = [lat for _, lat in points]
+        self.bbox = (min(lons), min(lats), max(lons), max(lats))
+        self.slab_count = max(1, min(64, len(points) // 8))
+        self.slab_height = max(self.bbox[3] - self.bbox[1], 1) / self.slab_count
+        self.slabs = [[] for _ in range(self.slab_count)]
+        for i in range(len(points)):
+            x1, y1 = points[i - 1]
+            x2, y2 = points[i]
+            if y1 == y2:
+                continue
+            first, last = self._slab(min(y1, y2)), self._slab(max(y1, y2))
+            edge = (x1, y1, x2, y2)
+            for slab in range(first, last + 1):
+                self.slabs[slab].append(edge)
+
+    def _slab(self, y):
+        return min(max(int((y - self.bbox[1]) / self.slab_height), 0), self.slab_count - 1)
+
+    def crossings(self, x, y):
+        """Number of edges a ray from (x, y) towards +x crosses, modulo 2"""
+        inside = False
+        for x1, y1, x2, y2 in self.slabs[self._slab(y)]:
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        return inside
+
+class Region:
+    def __init__(self, kind, code, name, rings):
+        self.kind = kind
+        self.code = code
+        self.name = name
+        self.rings = rings
+        self.bbox = (min(ring.bbox[0] for ring in rings), min(ring.bbox[1] for ring in rings),
+                     max(ring.bbox[2] for ring in rings), max(ring.bbox[3] for ring in rings))
+
+    def contains(self, x, y):
+        # Even-odd over every ring handles islands and holes (enclaves) alike
+        inside = False
+        for ring in self.rings:
+            bbox = ring.bbox
+            if bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3] and ring.crossings(x, y):
+                inside = not inside
+        return inside
+
+class Boundaries:
+    """Simplified country and US state polygons for resolving map regions offline"""
+
+    def __init__(self, regions):
+        self.regions = regions
+        self.names = {(region.kind, region.code): region.name for region in regions}
+        self.grids = {COUNTRY: {}, STATE: {}}
+        for region in regions:
+            grid = self.grids[region.kind]
+            min_col, min_row = _grid_cell(region.bbox[0], region.bbox[1])
+            max_col, max_row = _grid_cell(region.bbox[2], region.bbox[3])
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    grid.setdefault((row, col), []).append(region)
+        self._enclaves = None
+
+    def region_at(self, kind, lat, lon):
+        x, y = round(lon * COORDINATE_SCALE), round(lat * COORDINATE_SCALE)
+        col, row = _grid_cell(x, y)
+        for region in self.grids[kind].get((row, col), ()):
+            bbox = region.bbox
+            if bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3] and region.contains(x, y):
+                return region
+        return None
+
+    def resolve(self, lat, lon, fallback_cache=None):
+        """Return the BoundaryMatch for a point, or None if it is in no known country"""
+        country = self.region_at(COUNTRY, lat, lon)
+        state = None
+        if country is None or country.code == 'US':
+            state = self.region_at(STATE, lat, lon)
+        country_code = 'US' if state else (country.code if country else None)
+        state_code = state.code if state else None
+
+        location = None
+        enclave = self._enclave_at(lat, lon)
+        if enclave is not None:
+            # Micro-states vanish into their neighbours at this scale; the nearest town tells them apart
+            location = self._nearest_place(lat, lon, fallback_cache)
+            if location is not None and location.country_code == enclave:
+                country_code, state_code = enclave, None
+        if country_code is None or (country_code == 'US' and state_code is None):
+            # Simplified coastlines miss beaches and small islands; the nearest town settles those
+            location = location or self._nearest_place(lat, lon, fallback_cache)
+            if location is not None:
+                country_code = country_code or location.country_code
+                if country_code == 'US' and location.country_code == 'US':
+                    state_code = STATE_MAPPING.get(location.state)
+        if country_code is None:
+            return None
+
+        country_name = self.names.get((COUNTRY, country_code)) or (location.country if location else country_code)
+        state_name = self.names.get((STATE, state_code)) if state_code else None
+        return BoundaryMatch(country_code, country_name, state_code, state_name)
+
+    def resolve_many(self, points):
+        """Resolve [(lat, lon), ...] in one call.
+
+        Points are bucketed into small cells; a cell no boundary passes through is
+        resolved once for all of its points, and only points in cells a border
+        crosses are tested one by one.
+        """
+        cells = {}
+        floor = math.floor
+        for index, (lat, lon) in enumerate(points):
+            cell = (floor(lat * CELL_SCALE), floor(lon * CELL_SCALE))
+            indexes = cells.get(cell)
+            if indexes is None:
+                cells[cell] = [index]
+            else:
+                indexes.append(index)
+
+        fallback_cache = {}
+        matches = [None] * len(points)
+        for cell, indexes in cells.items():
+            if len(indexes) == 1 or not self._crosses_boundary(cell):
+                match = self.resolve(*points[indexes[0]], fallback_cache)
+                for index in indexes:
+                    matches[index] = match
+                continue
+            keys = {}
+            for index in indexes:
+                lat, lon = points[index]
+                keys.setdefault((round(lat, BATCH_PRECISION), round(lon, BATCH_PRECISION)), []).append(index)
+            for key_indexes in keys.values():
+                match = self.resolve(*points[key_indexes[0]], fallback_cache)
+                for index in key_indexes:
+                    matches[index] = match
+        return matches
+
+    def _crosses_boundary(self, cell):
+        """Whether any border edge passes through the cell, or an enclave's box touches it"""
+        size = COORDINATE_SCALE // CELL_SCALE
+        y0, x0 = cell[0] * size, cell[1] * size
+        y1, x1 = y0 + size, x0 + size
+        prefilter_cells = {_grid_cell(x, y)[::-1] for x in (x0, x1) for y in (y0, y1)}
+        for grid_cell in prefilter_cells:
+            for _, bbox in self._enclave_grid().get(grid_cell, ()):
+                if not (bbox[0] > x1 or bbox[2] < x0 or bbox[1] > y1 or bbox[3] < y0):
+                    return True
+        for grid in self.grids.values():
+            regions = {region for grid_cell in prefilter_cells for region in grid.get(grid_cell, ())}
+            for region in regions:
+                bbox = region.bbox
+                if bbox[0] > x1 or bbox[2] < x0 or bbox[1] > y1 or bbox[3] < y0:
+                    continue
+                for ring in region.rings:
+                    bbox = ring.bbox
+                    if bbox[0] > x1 or bbox[2] < x0 or bbox[1] > y1 or bbox[3] < y0:
+                        continue
+                    for slab in range(ring._slab(y0), ring._slab(y1) + 1):
+                        for ex1, ey1, ex2, ey2 in ring.slabs[slab]:
+                            if (min(ex1, ex2) > x1 or max(ex1, ex2) < x0
+                                    or min(ey1, ey2) > y1 or max(ey1, ey2) < y0):
+                                continue
+                            # The edge's line misses the cell when all four corners lie on one side of it
+                            dx, dy = ex2 - ex1, ey2 - ey1
+                            sides = [dx * (y - ey1) - dy * (x - ex1) for x in (x0, x1) for y in (y0, y1)]
+                            if not (min(sides) > 0 or max(sides) < 0):
+                                return True
+        return False
+
+    def _enclave_at(self, lat, lon):
+        x, y = round(lon * COORDINATE_SCALE), round(lat * COORDINATE_SCALE)
+        col, row = _grid_cell(x, y)
+        for code, bbox in self._enclave_grid().get((row, col), ()):
+            if bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3]:
+                return code
+        return None
+
+    def _enclave_grid(self):
+        """Bounding boxes, from the gazetteer's towns, of small countries with no outline here"""
+        if self._enclaves is not None:
+            return self._enclaves
+        self._enclaves = {}
+        gazetteer = get_gazetteer()
+        if gazetteer is None:
+            return self._enclaves
+
+        outlined = {region.code for region in self.regions if region.kind == COUNTRY}
+        bboxes = {}
+        for index in range(len(gazetteer)):
+            code = gazetteer.country_table[gazetteer.countries[index]][0]
+            if code in outlined:
+                continue
+            x, y = gazetteer.lons[index], gazetteer.lats[index]
+            bbox = bboxes.get(code)
+            bboxes[code] = (min(bbox[0], x), min(bbox[1], y), max(bbox[2], x), max(bbox[3], y)) if bbox else (x, y, x, y)
+
+        max_size = ENCLAVE_MAX_DEGREES * COORDINATE_SCALE
+        margin = round(ENCLAVE_MARGIN_DEGREES * COORDINATE_SCALE)
+        for code, bbox in bboxes.items():
+            if bbox[2] - bbox[0] > max_size or bbox[3] - bbox[1] > max_size:
+                continue
+            bbox = (bbox[0] - margin, bbox[1] - margin, bbox[2] + margin, bbox[3] + margin)
+            min_col, min_row = _grid_cell(bbox[0], bbox[1])
+            max_col, max_row = _grid_cell(bbox[2], bbox[3])
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    self._enclaves.setdefault((row, col), []).append((code, bbox))
+        return self._enclaves
+
+    def _nearest_place(self, lat, lon, fallback_cache):
+        if fallback_cache is None:
+            return reverse_geocode(lat, lon)
+        # A kilometre either way does not change which country's town is nearest
+        key = (round(lat, FALLBACK_PRECISION), round(lon, FALLBACK_PRECISION))
+        if key not in fallback_cache:
+            fallback_cache[key] = reverse_geocode(lat, lon)
+        return fallback_cache[key]
+
+def _grid_cell(x, y):
+    return (int((x / COORDINATE_SCALE + 180) // PREFILTER_DEGREES),
+            int((y / COORDINATE_SCALE + 90) // PREFILTER_DEGREES))
+
+def load_boundaries(path=BOUNDARIES_PATH):
+    """Read a boundaries file written by write_boundaries"""
+    with open(path, 'rb') as f:
+        magic, version, region_count = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != BOUNDARIES_MAGIC or version != BOUNDARIES_VERSION:
+            raise ValueError(f"Not a version {BOUNDARIES_VERSION} boundaries file: {path}")
+        payload = zlib.decompress(f.read())
+
+    regions = []
+    pos = 0
+    for _ in range(region_count):
+        kind, code, name_length = struct.unpack_from('<B2sH', payload, pos)
+        pos += 5
+        name = payload[pos:pos + name_length].decode('utf-8')
+        pos += name_length
+        ring_count = struct.unpack_from('<H', payload, pos)[0]
+        pos += 2
+        rings = []
+        for _ in range(ring_count):
+            point_count = struct.unpack_from('<I', payload, pos)[0]
+            pos += 4
+            coordinates = struct.unpack_from(f'<{point_count * 2}i', payload, pos)
+            pos += point_count * 8
+            rings.append(Ring(list(zip(coordinates[0::2], coordinates[1::2]))))
+        regions.append(Region(kind, code.decode('ascii'), name, rings))
+    return Boundaries(regions)
+
+def write_boundaries(path, regions):
+    """Write regions [(kind, code, name, [[(lon, lat), ...], ...])] to path"""
+    payload = bytearray()
+    for kind, code, name, rings in regions:
+        encoded_name = name.encode('utf-8')
+        payload += struct.pack('<B2sH', kind, code.encode('ascii'), len(encoded_name)) + encoded_name
+        payload += struct.pack('<H', len(rings))
+        for ring in rings:
+            coordinates = [round(value * COORDINATE_SCALE) for point in ring for value in point[:2]]
+            payload += struct.pack(f'<I{len(coordinates)}i', len(ring), *coordinates)
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(BOUNDARIES_MAGIC, BOUNDARIES_VERSION, len(regions)))
+        f.write(zlib.compress(bytes(payload), 9))
+    return len(regions)
+
+def get_boundaries():
+    """Load the bundled boundaries once per process; None if they are missing or unreadable"""
+    global _boundaries, _boundaries_loaded
+    if _boundaries_loaded:
+        return _boundaries
+    with _boundaries_lock:
+        if not _boundaries_loaded:
+            try:
+                _boundaries = load_boundaries()
+            except (OSError, ValueError, zlib.error, struct.error) as e:
+                print(f"Error loading map boundaries: {e}")
+                _boundaries = None
+            _boundaries_loaded = True
+    return _boundaries
@@ -1,6 +1,89 @@
+import os
+
 IMAGE_FORMATS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp', '.heic']
 VIDEO_FORMATS = ['.mp4', '.avi', '.mov', '.mkv', '.m4v']
 SUPPORTED_MEDIA_FORMATS = IMAGE_FORMATS + VIDEO_FORMATS
+# Video containers whose metadata can be read natively from the moov box
+QUICKTIME_FORMATS = ['.mp4', '.mov', '.m4v']
+# Image containers whose EXIF is read without going through Pillow's HEIF decoder
+HEIF_FORMATS = ['.heic', '.heif']
+
+# Number of long-lived ExifTool processes shared by the workers
+EXIFTOOL_POOL_SIZE = 2
+
+# Number of file paths sent to ExifTool in a single request
+EXIFTOOL_BATCH_SIZE = 200
+
+# Worker processes used for metadata extraction (1 extracts in the worker thread itself)
+EXTRACTION_WORKERS = os.cpu_count() or 1
+# Number of files handed to an extraction worker process at a time
+EXTRACTION_CHUNK_SIZE = 64
+# Background prefetch after a folder is picked: how long to wait for typing to settle, and
+# how many files it reads between checks for a real operation, which stops it
+PREFETCH_DELAY_MS = 750
+PREFETCH_BATCH_SIZE = 32
+
+# Per-user storage for caches and other state kept between sessions
+APP_DATA_DIR = os.path.join(os.path.expanduser("~"), ".picpoint")
+METADATA_CACHE_PATH = os.path.join(APP_DATA_DIR, "metadata_cache.sqlite3")
+METADATA_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Reverse geocoding answers are shared by every point in the same geohash cell
+GEOCODE_CACHE_PATH = os.path.join(APP_DATA_DIR, "geocode_cache.sqlite3")
+# 6 characters is a cell of about 1.2 km, 7 about 150 m, 8 about 40 m
+GEOCODE_CACHE_PRECISION = 7
+GEOCODE_CACHE_MAX_ENTRIES = 200000
+GEOCODE_CACHE_TTL_DAYS = 180
+# Every operation that moves files logs its plan here, so a crash partway can be resumed
+JOURNAL_DIR = os.path.join(APP_DATA_DIR, "journals")
+# Finished moves are synced to disk in batches of this many
+JOURNAL_SYNC_EVERY = 256
+JOURNAL_KEEP = 20
+# Files whose location lookup failed wait here, inside the sorted folder, for a later run
+PENDING_FOLDER = "Pending Location"
+# Folder levels a location sort creates, by depth; 1 keeps the flat one-folder-per-city layout
+PLACE_FOLDER_LAYOUTS = {
+    1: ('city',),
+    2: ('country', 'city'),
+    3: ('country', 'state', 'city'),
+    4: ('country', 'state', 'city', 'suburb'),
+}
+LOCATION_FOLDER_DEPTH = 1
+# Photos within this many metres of each other are geocoded once per run
+GEOCODE_CLUSTER_RADIUS_M = 100
+# User-defined named places, matched before any geocoding
+GEOFENCES_PATH = os.path.join(APP_DATA_DIR, "geofences.json")
+# Grid cell of about 1 km; fences spanning more cells than the limit are tested by bounding box
+GEOFENCE_CELL_DEGREES = 0.01
+GEOFENCE_MAX_CELLS = 10000
+
+# Bundled GeoNames places used for reverse geocoding without a network
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+GAZETTEER_PATH = os.path.join(ASSETS_DIR, "gazetteer.bin")
+# Simplified country and US state outlines for map generation
+BOUNDARIES_PATH = os.path.join(ASSETS_DIR, "boundaries.bin")
+# Points farther than this from any known place are left to the online fallback
+GEOCODER_MAX_DISTANCE_KM = 50
+# A town this close decides the country and state; the map outlines only settle points farther out.
+# Large cities have one gazetteer point for their whole area, so this spans a city's own extent
+GEOCODER_TOWN_TRUST_KM = 10
+# Ask an online geocoder when the offline gazetteer has no answer
+GEOCODER_ONLINE_FALLBACK = False
+# Which online geocoder answers: 'nominatim' (the public server) or 'self_hosted'
+GEOCODER_BACKEND = 'nominatim'
+NOMINATIM_URL = "https://nominatim.openstreetmap.org"
+# The public server's usage policy allows one request per second
+NOMINATIM_RATE_PER_SECOND = 1.0
+SELF_HOSTED_NOMINATIM_URL = "http://localhost:8080"
+SELF_HOSTED_RATE_PER_SECOND = 50.0
+SELF_HOSTED_CONCURRENCY = 16
+GEOCODER_BURST = 1
+# Places answered offline in one batch; online lookups for the rest start as each batch fills
+PLACE_BATCH_SIZE = 256
+# Lookups in flight at once, overlapping network latency with extraction
+GEOCODER_CONCURRENCY = 4
+GEOCODER_TIMEOUT = 10
+GEOCODER_MAX_RETRIES = 3
+GEOCODER_USER_AGENT = "Media GPS Extractor/1.0"
 
 # State mapping (Full name to abbreviation)
 STATE_MAPPING = {
@@ -53,7 +136,9 @@ STATE_MAPPING = {
     'Washington': 'WA',
     'West Virginia': 'WV',
     'Wisconsin': 'WI',
-    'Wyoming': 'WY'
+    'Wyoming': 'WY',
+    'Washington, D.C.': 'DC',
+    'District of Columbia': 'DC'
 }
 
 # Country mapping (Various names to standard English name)
@@ -65,6 +150,7 @@ COUNTRY_MAPPING = {
     'America': 'United States',
     'UK': 'United Kingdom',
     'Great Britain': 'United Kingdom',
+    'The Netherlands': 'Netherlands',
     
     # Arabic names
     'المملكة العربية السعودية': 'Saudi Arabia',
@@ -0,0 +1,340 @@
+from media_io import open_window, BytesWindow, iter_boxes
+from datetime import datetime
+import struct
+
+# Largest EXIF block or HEIF meta box we are willing to pull into memory
+MAX_METADATA_BYTES = 1024 * 1024
+
+EXIF_IFD_POINTER = 0x8769
+GPS_IFD_POINTER = 0x8825
+DATETIME_ORIGINAL = 0x9003
+OFFSET_TIME = 0x9010
+OFFSET_TIME_ORIGINAL = 0x9011
+PIXEL_X_DIMENSION = 0xA002
+PIXEL_Y_DIMENSION = 0xA003
+IMAGE_WIDTH = 0x0100
+IMAGE_LENGTH = 0x0101
+GPS_LATITUDE_REF = 1
+GPS_LATITUDE = 2
+GPS_LONGITUDE_REF = 3
+GPS_LONGITUDE = 4
+
+TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8, 13: 4}
+# JPEG start-of-frame markers (excluding DHT, JPG and DAC which share the range)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+HEIF_BRANDS = (b'heic', b'heix', b'heim', b'heis', b'hevc', b'hevx', b'mif1', b'msf1', b'avif')
+
+def read_exif_header(file_path):
+    """Read GPS, capture time and size straight from the headers of a JPEG, TIFF or HEIF file.
+
+    Returns None when the file is not one of those formats or its metadata is malformed,
+    so callers can fall back to a slower reader. Otherwise returns a dict with 'gps',
+    'datetime_original', 'offset_time', 'width' and 'height' keys, any of which may be None.
+    """
+    with open_window(file_path) as window:
+        head = window.read_at(0, 16)
+        result = {'gps': None, 'datetime_original': None, 'offset_time': None,
+                  'width': None, 'height': None}
+
+        try:
+            if head[:2] == b'\xff\xd8':
+                tiff = _scan_jpeg(window, result)
+            elif head[:4] in (b'II*\x00', b'MM\x00*'):
+                tiff = (window, 0)
+            elif head[4:8] == b'ftyp' and head[8:12] in HEIF_BRANDS:
+                tiff = _find_heif_exif(window, result)
+            else:
+                return None
+
+            if tiff is not None:
+                _parse_tiff(tiff[0], tiff[1], result)
+            return result
+        except (struct.error, IndexError, ValueError):
+            return None
+
+def parse_exif_block(data):
+    """Decode an EXIF block already in memory (with or without its 'Exif' prefix)"""
+    result = {'gps': None, 'datetime_original': None, 'offset_time': None,
+              'width': None, 'height': None}
+    base = 6 if data[:6] == b'Exif\x00\x00' else 0
+    try:
+        _parse_tiff(BytesWindow(data), base, result)
+    except (struct.error, IndexError, ValueError):
+        pass
+    return result
+
+def _scan_jpeg(window, result):
+    """Walk the JPEG marker segments up to the frame header, returning the APP1 Exif block"""
+    tiff = None
+    offset = 2
+    while True:
+        marker = window.read_at(offset, 4)
+        if len(marker) < 4 or marker[0] != 0xFF:
+            return tiff
+
+        marker_type = marker[1]
+        if marker_type == 0xFF:
+            # Fill byte
+            offset += 1
+            continue
+        if marker_type == 0xDA or marker_type == 0xD9:
+            # Start of scan or end of image: nothing more to find
+            return tiff
+
+        length = struct.unpack('>H', marker[2:4])[0]
+        if marker_type == 0xE1 and tiff is None and window.read_at(offset + 4, 6) == b'Exif\x00\x00':
+            tiff = (window, offset + 10)
+        elif marker_type in JPEG_SOF_MARKERS:
+            frame = window.read_at(offset + 5, 4)
+            if len(frame) == 4:
+                result['height'], result['width'] = struct.unpack('>HH', frame)
+            # The EXIF block always precedes the frame header
+            return tiff
+        offset += 2 + length
+
+def _find_heif_exif(window, result):
+    """Locate the Exif item of a HEIF file through its meta/iinf/iloc boxes"""
+    meta = None
+    for box_type, start, end in iter_boxes(window, 0, None):
+        if box_type == b'meta':
+            size = end - start
+            if size > MAX_METADATA_BYTES:
+                return None
+            meta = window.read_at(start, size)
+            break
+    if meta is None:
+        return None
+
+    meta_window = BytesWindow(meta)
+    boxes = {box_type: (start, end) for box_type, start, end in iter_boxes(meta_window, 4, len(meta))}
+    if b'iprp' in boxes:
+        _read_heif_size(meta, *boxes[b'iprp'], result)
+    if b'iinf' not in boxes or b'iloc' not in boxes:
+        return None
+
+    exif_id = _find_exif_item_id(meta, *boxes[b'iinf'])
+    if exif_id is None:
+        return None
+
+    extent = _find_item_extent(meta, exif_id, *boxes[b'iloc'])
+    if extent is None:
+        return None
+
+    construction_method, offset, length = extent
+    if length > MAX_METADATA_BYTES:
+        return None
+    if construction_method == 1:
+        if b'idat' not in boxes:
+            return None
+        data = meta[boxes[b'idat'][0] + offset:boxes[b'idat'][0] + offset + length]
+    elif construction_method == 0:
+        data = window.read_at(offset, length)
+    else:
+        return None
+
+    # The Exif item starts with the offset from its payload to the TIFF header
+    if len(data) < 4:
+        return None
+    tiff_offset = 4 + struct.unpack('>I', data[:4])[0]
+    return BytesWindow(data), tiff_offset
+
+def _read_heif_size(meta, start, end, result):
+    """Take the largest 'ispe' property as the image size; tiles and thumbnails are smaller"""
+    meta_window = BytesWindow(meta)
+    for box_type, ipco_start, ipco_end in iter_boxes(meta_window, start, end):
+        if box_type != b'ipco':
+            continue
+        for prop_type, prop_start, prop_end in iter_boxes(meta_window, ipco_start, ipco_end):
+            if prop_type != b'ispe' or prop_end - prop_start < 12:
+                continue
+            width, height = struct.unpack('>II', meta[prop_start + 4:prop_start + 12])
+            if width * height > (result['width'] or 0) * (result['height'] or 0):
+                result['width'], result['height'] = width, height
+
+def _find_exif_item_id(meta, start, end):
+    version = meta[start]
+    pos = start + 4
+    if version == 0:
+        entry_count = struct.unpack('>H', meta[pos:pos + 2])[0]
+        pos += 2
+    else:
+        entry_count = struct.unpack('>I', meta[pos:pos + 4])[0]
+        pos += 4
+
+    meta_window = BytesWindow(meta)
+    for index, (box_type, infe_start, infe_end) in enumerate(iter_boxes(meta_window, pos, end)):
+        if index >= entry_count:
+            break
+        if box_type != b'infe':
+            continue
+        infe_version = meta[infe_start]
+        if infe_version < 2:
+            continue
+        pos = infe_start + 4
+        if infe_version == 2:
+            item_id = struct.unpack('>H', meta[pos:pos + 2])[0]
+            pos += 2
+        else:
+            item_id = struct.unpack('>I', meta[pos:pos + 4])[0]
+            pos += 4
+        # Skip item_protection_index
+        item_type = meta[pos + 2:pos + 6]
+        if item_type == b'Exif':
+            return item_id
+    return None
+
+def _read_uint(data, pos, size):
+    if size == 0:
+        return 0
+    if size == 4:
+        return struct.unpack('>I', data[pos:pos + 4])[0]
+    if size == 8:
+        return struct.unpack('>Q', data[pos:pos + 8])[0]
+    raise ValueError(f"Unsupported iloc field size: {size}")
+
+def _find_item_extent(meta, item_id, start, end):
+    """Return (construction_method, offset, length) of the item's first extent"""
+    version = meta[start]
+    pos = start + 4
+    offset_size = meta[pos] >> 4
+    length_size = meta[pos] & 0x0F
+    base_offset_size = meta[pos + 1] >> 4
+    index_size = meta[pos + 1] & 0x0F if version in (1, 2) else 0
+    pos += 2
+
+    if version < 2:
+        item_count = struct.unpack('>H', meta[pos:pos + 2])[0]
+        pos += 2
+    else:
+        item_count = struct.unpack('>I', meta[pos:pos + 4])[0]
+        pos += 4
+
+    for _ in range(item_count):
+        if pos >= end:
+            return None
+        if version < 2:
+            current_id = struct.unpack('>H', meta[pos:pos + 2])[0]
+            pos += 2
+        else:
+            current_id = struct.unpack('>I', meta[pos:pos + 4])[0]
+            pos += 4
+
+        construction_method = 0
+        if version in (1, 2):
+            construction_method = struct.unpack('>H', meta[pos:pos + 2])[0] & 0x0F
+            pos += 2
+        pos += 2  # data_reference_index
+        base_offset = _read_uint(meta, pos, base_offset_size)
+        pos += base_offset_size
+        extent_count = struct.unpack('>H', meta[pos:pos + 2])[0]
+        pos += 2
+
+        extents = []
+        for _ in range(extent_count):
+            pos += index_size
+            extent_offset = _read_uint(meta, pos, offset_size)
+            pos += offset_size
+            extent_length = _read_uint(meta, pos, length_size)
+            pos += length_size
+            extents.append((extent_offset, extent_length))
+
+        if current_id == item_id and extents:
+            extent_offset, extent_length = extents[0]
+            # Exif items are stored in a single extent in practice
+            return construction_method, base_offset + extent_offset, extent_length
+    return None
+
+def _parse_tiff(window, base, result):
+    """Fill result from the IFD0 -> Exif/GPS IFDs of a TIFF structure starting at base"""
+    header = window.read_at(base, 8)
+    if len(header) < 8:
+        return
+    if header[:2] == b'II':
+        endian = '<'
+    elif header[:2] == b'MM':
+        endian = '>'
+    else:
+        return
+
+    ifd0_offset = struct.unpack(endian + 'I', header[4:8])[0]
+    ifd0 = _read_ifd(window, base, ifd0_offset, endian,
+                     (EXIF_IFD_POINTER, GPS_IFD_POINTER, IMAGE_WIDTH, IMAGE_LENGTH))
+
+    if base == 0 and ifd0.get(IMAGE_WIDTH) and ifd0.get(IMAGE_LENGTH):
+        # Only a bare TIFF describes the image itself in IFD0
+        result['width'] = ifd0[IMAGE_WIDTH][0]
+        result['height'] = ifd0[IMAGE_LENGTH][0]
+
+    if EXIF_IFD_POINTER in ifd0:
+        exif_ifd = _read_ifd(window, base, ifd0[EXIF_IFD_POINTER][0], endian,
+                             (DATETIME_ORIGINAL, OFFSET_TIME_ORIGINAL, OFFSET_TIME,
+                              PIXEL_X_DIMENSION, PIXEL_Y_DIMENSION))
+        if result['width'] is None and exif_ifd.get(PIXEL_X_DIMENSION) and exif_ifd.get(PIXEL_Y_DIMENSION):
+            result['width'] = exif_ifd[PIXEL_X_DIMENSION][0]
+            result['height'] = exif_ifd[PIXEL_Y_DIMENSION][0]
+        date_value = exif_ifd.get(DATETIME_ORIGINAL)
+        if date_value:
+            try:
+                result['datetime_original'] = datetime.strptime(date_value, "%Y:%m:%d %H:%M:%S")
+            except ValueError:
+                pass
+        result['offset_time'] = exif_ifd.get(OFFSET_TIME_ORIGINAL) or exif_ifd.get(OFFSET_TIME)
+
+    if GPS_IFD_POINTER in ifd0:
+        gps_ifd = _read_ifd(window, base, ifd0[GPS_IFD_POINTER][0], endian,
+                            (GPS_LATITUDE_REF, GPS_LATITUDE, GPS_LONGITUDE_REF, GPS_LONGITUDE))
+        lat = gps_ifd.get(GPS_LATITUDE)
+        lon = gps_ifd.get(GPS_LONGITUDE)
+        lat_ref = gps_ifd.get(GPS_LATITUDE_REF)
+        lon_ref = gps_ifd.get(GPS_LONGITUDE_REF)
+        if lat and lon and lat_ref and lon_ref and len(lat) == 3 and len(lon) == 3:
+            lat = _to_degrees(lat)
+            lon = _to_degrees(lon)
+            if lat is not None and lon is not None:
+                result['gps'] = (-lat if lat_ref == 'S' else lat, -lon if lon_ref == 'W' else lon)
+
+def _read_ifd(window, base, offset, endian, wanted):
+    """Read only the wanted tags of one IFD"""
+    values = {}
+    count_data = window.read_at(base + offset, 2)
+    if len(count_data) < 2:
+        return values
+    entry_count = struct.unpack(endian + 'H', count_data)[0]
+    entries = window.read_at(base + offset + 2, entry_count * 12)
+
+    for index in range(len(entries) // 12):
+        tag, value_type, count = struct.unpack(endian + 'HHI', entries[index * 12:index * 12 + 8])
+        if tag not in wanted or value_type not in TIFF_TYPE_SIZES:
+            continue
+
+        size = TIFF_TYPE_SIZES[value_type] * count
+        raw = entries[index * 12 + 8:index * 12 + 12]
+        if size > 4:
+            if size > MAX_METADATA_BYTES:
+                continue
+            raw = window.read_at(base + struct.unpack(endian + 'I', raw)[0], size)
+        else:
+            raw = raw[:size]
+        if len(raw) < size:
+            continue
+
+        if value_type == 2:
+            values[tag] = bytes(raw).split(b'\x00', 1)[0].decode('ascii', 'replace').strip()
+        elif value_type in (5, 10):
+            fmt = endian + ('I' if value_type == 5 else 'i') * (2 * count)
+            numbers = struct.unpack(fmt, raw)
+            values[tag] = [(numbers[i], numbers[i + 1]) for i in range(0, len(numbers), 2)]
+        elif value_type == 3:
+            values[tag] = list(struct.unpack(endian + 'H' * count, raw))
+        elif value_type in (4, 9, 13):
+            values[tag] = list(struct.unpack(endian + ('i' if value_type == 9 else 'I') * count, raw))
+        else:
+            values[tag] = bytes(raw)
+    return values
+
+def _to_degrees(value):
+    try:
+        d, m, s = (float(num) / float(den) for num, den in value)
+    except ZeroDivisionError:
+        return None
+    return d + (m / 60.0) + (s / 3600.0)
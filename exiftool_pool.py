@@ -0,0 +1,98 @@
+from constants import EXIFTOOL_POOL_SIZE
+from contextlib import contextmanager
+import threading
+import exiftool
+import queue
+
+class ExifToolPool:
+    """Thread-safe pool of long-lived `-stay_open` ExifTool processes"""
+
+    def __init__(self, size=EXIFTOOL_POOL_SIZE):
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def acquire(self, timeout=None):
+        """Check a running ExifTool process out of the pool"""
+        if self._closed:
+            raise RuntimeError("ExifTool pool has been shut down")
+
+        try:
+            et = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+
+            if can_create:
+                try:
+                    et = exiftool.ExifToolHelper()
+                except Exception:
+                    # e.g. no exiftool on PATH; give the slot back so callers fail instead of blocking
+                    self._discard()
+                    raise
+            else:
+                et = self._idle.get(timeout=timeout)
+
+        # Processes that died while idle (or were never started) are restarted here
+        if not et.running:
+            try:
+                et.run()
+            except Exception:
+                self._discard()
+                raise
+        return et
+
+    def release(self, et):
+        """Check a process back into the pool, stopping it if the pool is closed"""
+        if self._closed:
+            self._terminate(et)
+            return
+        self._idle.put(et)
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        et = self.acquire(timeout)
+        try:
+            yield et
+        except (OSError, exiftool.exceptions.ExifToolProcessStateError,
+                exiftool.exceptions.ExifToolOutputEmptyError):
+            # The pipe is gone or out of sync; stop it so the next checkout restarts it
+            self._terminate(et)
+            raise
+        finally:
+            self.release(et)
+
+    def shutdown(self):
+        """Stop every idle process; processes still checked out stop on release"""
+        self._closed = True
+        while True:
+            try:
+                et = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._terminate(et)
+
+    def _discard(self):
+        with self._lock:
+            self._created -= 1
+
+    def _terminate(self, et):
+        try:
+            if et.running:
+                et.terminate()
+        except Exception as e:
+            print(f"Error stopping ExifTool process: {e}")
+
+@contextmanager
+def exiftool_session(pool=None):
+    """Yield an ExifTool helper from the pool, or a one-off process if no pool is given"""
+    if pool is not None:
+        with pool.checkout() as et:
+            yield et
+    else:
+        with exiftool.ExifToolHelper() as et:
+            yield et
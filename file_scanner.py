@@ -0,0 +1,50 @@
+import os
+
+def scan_files(root, extensions=None, min_depth=0, max_depth=None, skip_dirs=(), onerror=None,
+               should_stop=None):
+    """Yield an os.DirEntry for every file under root, in the order os.walk would list them.
+
+    Depth 0 is root's own files and max_depth=None goes all the way down.
+    Files and folders are told apart by the type the directory listing
+    already carries, so nothing is stat'ed while scanning, and entry.stat()
+    answers from the listing on Windows. extensions are lowercase and include
+    the dot. Folders named in skip_dirs are not entered, and symlinked folders
+    are not followed. A folder that cannot be read raises OSError, or with
+    onerror it is passed there and skipped, as os.walk does. should_stop is
+    checked before each folder is listed.
+    """
+    if extensions is not None:
+        extensions = tuple(extensions)
+    stack = [(root, 0)]
+    while stack:
+        if should_stop is not None and should_stop():
+            return
+        folder, depth = stack.pop()
+        subfolders = []
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if (max_depth is None or depth < max_depth) and entry.name not in skip_dirs:
+                                subfolders.append((entry.path, depth + 1))
+                        elif depth >= min_depth and entry.is_file():
+                            if extensions is None or entry.name.lower().endswith(extensions):
+                                yield entry
+                    except OSError:
+                        continue  # Gone since it was listed
+        except OSError as e:
+            if onerror is None:
+                raise
+            onerror(e)
+            continue
+        stack.extend(reversed(subfolders))
+
+def scan_paths(root, **kwargs):
+    """Like scan_files, yielding plain paths"""
+    for entry in scan_files(root, **kwargs):
+        yield entry.path
+
+def has_files(root, **kwargs):
+    """Whether root holds at least one matching file; stops at the first it finds"""
+    return next(scan_files(root, **kwargs), None) is not None
@@ -0,0 +1,194 @@
+from constants import GEOCODE_CACHE_PATH, GEOCODE_CACHE_PRECISION, GEOCODE_CACHE_MAX_ENTRIES, GEOCODE_CACHE_TTL_DAYS
+from offline_geocoder import Place
+import sqlite3
+import time
+import os
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Answers are written in batches rather than one commit each
+WRITE_BATCH_SIZE = 256
+
+def geohash(lat, lon, precision=GEOCODE_CACHE_PRECISION):
+    """Encode coordinates as a geohash; 7 characters is a cell of roughly 150 m"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        coordinate, bounds = (lon, lon_range) if even else (lat, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = value = 0
+    return ''.join(chars)
+
+class GeocodeCache:
+    """SQLite cache of the online backend's Places keyed by geohash cell.
+
+    Photos taken a few metres apart land in the same cell and share one answer.
+    Entries older than the TTL are treated as misses, and the least recently
+    used entries are dropped once the cache holds more than max_entries.
+    """
+
+    def __init__(self, db_path=GEOCODE_CACHE_PATH, precision=GEOCODE_CACHE_PRECISION,
+                 max_entries=GEOCODE_CACHE_MAX_ENTRIES, ttl_days=GEOCODE_CACHE_TTL_DAYS):
+        self.db_path = db_path
+        self.precision = precision
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_days * 24 * 60 * 60
+        self.hits = 0
+        self.misses = 0
+        self.unwritten = {}
+        self.used = set()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # Earlier versions kept only the city, state and country in a geocode table, then offline
+        # answers alongside online ones in a places table
+        self.conn.execute("DROP TABLE IF EXISTS geocode")
+        self.conn.execute("DROP TABLE IF EXISTS places")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS online_places (
+                cell TEXT PRIMARY KEY,
+                country TEXT,
+                country_code TEXT,
+                state TEXT,
+                county TEXT,
+                city TEXT,
+                suburb TEXT,
+                created INTEGER NOT NULL,
+                last_used INTEGER NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS online_places_last_used ON online_places (last_used)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS online_places_created ON online_places (created)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pending (
+                path TEXT PRIMARY KEY,
+                folder TEXT NOT NULL,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                queued INTEGER NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS pending_folder ON pending (folder)")
+        self.conn.commit()
+        # Counted once here and kept up to date by flush and evict, so eviction never scans the table
+        self.count = self.conn.execute("SELECT COUNT(*) FROM online_places").fetchone()[0]
+
+    def get(self, lat, lon):
+        """Return (found, Place or None); a cached None means the service knew no place there"""
+        cell = geohash(lat, lon, self.precision)
+        if cell in self.unwritten:
+            self.hits += 1
+            place = self.unwritten[cell][1:7]
+            return True, Place(*place) if any(place) else None
+
+        row = self.conn.execute("SELECT country, country_code, state, county, city, suburb, created "
+                                "FROM online_places WHERE cell = ?", (cell,)).fetchone()
+        if row is None or int(time.time()) - row[6] > self.ttl_seconds:
+            self.misses += 1
+            return False, None
+
+        self.hits += 1
+        # last_used is written with the next batch
+        self.used.add(cell)
+        if not any(row[:6]):
+            return True, None
+        return True, Place(*row[:6])
+
+    def put(self, lat, lon, place):
+        """Remember the answer for the coordinates' cell; None records that there was no place"""
+        now = int(time.time())
+        cell = geohash(lat, lon, self.precision)
+        values = tuple(place) if place is not None else (None,) * len(Place._fields)
+        self.unwritten[cell] = (cell, *values, now, now)
+        if len(self.unwritten) >= WRITE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Write batched answers and last-used times, then evict"""
+        if self.unwritten:
+            cells = list(self.unwritten)
+            replaced = self.conn.execute(
+                f"SELECT COUNT(*) FROM online_places WHERE cell IN ({', '.join('?' * len(cells))})",
+                cells).fetchone()[0]
+            self.conn.executemany("INSERT OR REPLACE INTO online_places VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                  list(self.unwritten.values()))
+            self.count += len(cells) - replaced
+        if self.used:
+            now = int(time.time())
+            self.conn.executemany("UPDATE online_places SET last_used = ? WHERE cell = ?",
+                                  [(now, cell) for cell in self.used])
+        self.conn.commit()
+        if self.unwritten:
+            self.evict()
+        self.unwritten = {}
+        self.used = set()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones beyond max_entries"""
+        self.count -= self.conn.execute("DELETE FROM online_places WHERE created < ?",
+                                        (int(time.time()) - self.ttl_seconds,)).rowcount
+        excess = self.count - self.max_entries
+        if excess > 0:
+            self.count -= self.conn.execute(
+                "DELETE FROM online_places WHERE cell IN (SELECT cell FROM online_places ORDER BY last_used LIMIT ?)",
+                (excess,)).rowcount
+        self.conn.commit()
+
+    def queue_pending(self, entries):
+        """Remember files [(staged path, sorted folder, lat, lon)] whose location could not be resolved yet"""
+        now = int(time.time())
+        self.conn.executemany("INSERT OR REPLACE INTO pending VALUES (?, ?, ?, ?, ?)",
+                              [(path, folder, lat, lon, now) for path, folder, lat, lon in entries])
+        self.conn.commit()
+
+    def pending_in(self, folder):
+        """Return [(staged path, lat, lon)] queued for a sorted folder, oldest first"""
+        return self.conn.execute("SELECT path, lat, lon FROM pending WHERE folder = ? ORDER BY queued",
+                                 (folder,)).fetchall()
+
+    def remove_pending(self, paths):
+        self.conn.executemany("DELETE FROM pending WHERE path = ?", [(path,) for path in paths])
+        self.conn.commit()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats_message(self):
+        return (f"Geocode cache: {self.hits} hits, {self.misses} misses "
+                f"({self.hit_rate:.0%} hit rate)")
+
+    def clear(self):
+        # The pending queue is left alone: it records where parked files belong
+        self.unwritten = {}
+        self.used = set()
+        self.conn.execute("DELETE FROM online_places")
+        self.conn.commit()
+        self.count = 0
+        self.conn.execute("VACUUM")
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+def open_geocode_cache():
+    """Open the shared cache, or return None so lookups simply go to the service"""
+    try:
+        return GeocodeCache()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error opening geocode cache: {e}")
+        return None
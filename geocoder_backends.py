@@ -0,0 +1,173 @@
+from constants import (GEOCODER_BACKEND, NOMINATIM_URL, NOMINATIM_RATE_PER_SECOND, SELF_HOSTED_NOMINATIM_URL,
+                       SELF_HOSTED_RATE_PER_SECOND, SELF_HOSTED_CONCURRENCY, GEOCODER_BURST, GEOCODER_CONCURRENCY,
+                       GEOCODER_TIMEOUT, GEOCODER_MAX_RETRIES, GEOCODER_USER_AGENT)
+from concurrent.futures import ThreadPoolExecutor, Future
+from abc import ABC, abstractmethod
+from offline_geocoder import Place, get_gazetteer
+from requests.adapters import HTTPAdapter
+import threading
+import requests
+import time
+
+# Responses worth retrying; anything else is an answer
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30.0
+
+_backend = None
+_backend_lock = threading.Lock()
+
+class GeocodingError(Exception):
+    pass
+
+class TokenBucket:
+    """Blocking rate limiter shared by every thread that talks to one service"""
+
+    def __init__(self, rate_per_second, burst=1):
+        self.rate = rate_per_second
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class GeocoderBackend(ABC):
+    """A reverse geocoding service.
+
+    reverse() returns a Place, or None when the service knows no place at
+    the coordinates, and raises GeocodingError when it cannot answer right now.
+    """
+    name = None
+
+    @abstractmethod
+    def reverse(self, lat, lon):
+        pass
+
+    def submit(self, lat, lon):
+        """Start a lookup and return its Future; backends without a thread pool answer at once"""
+        future = Future()
+        try:
+            future.set_result(self.reverse(lat, lon))
+        except GeocodingError as e:
+            future.set_exception(e)
+        return future
+
+    def close(self):
+        pass
+
+class OfflineBackend(GeocoderBackend):
+    """The bundled GeoNames gazetteer"""
+    name = 'offline'
+
+    def reverse(self, lat, lon):
+        gazetteer = get_gazetteer()
+        if gazetteer is None:
+            raise GeocodingError("The offline gazetteer is not available")
+        return gazetteer.nearest(lat, lon)
+
+class NominatimBackend(GeocoderBackend):
+    """Nominatim reverse geocoding over one keep-alive session.
+
+    Requests from every thread share the token bucket, so the configured rate
+    holds however many lookups run at once. 429 and 5xx responses and network
+    errors are retried with exponential backoff, honouring Retry-After.
+    """
+    name = 'nominatim'
+
+    def __init__(self, base_url=NOMINATIM_URL, rate_per_second=NOMINATIM_RATE_PER_SECOND,
+                 burst=GEOCODER_BURST, concurrency=GEOCODER_CONCURRENCY, timeout=GEOCODER_TIMEOUT,
+                 max_retries=GEOCODER_MAX_RETRIES, user_agent=GEOCODER_USER_AGENT):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.limiter = TokenBucket(rate_per_second, burst)
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='geocoder')
+
+    def reverse(self, lat, lon):
+        params = {"lat": lat, "lon": lon, "format": "json"}
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            retry_after = None
+            try:
+                response = self.session.get(f"{self.base_url}/reverse", params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                error = f"Unable to fetch location data: {e}"
+            else:
+                if response.status_code == 200:
+                    try:
+                        return _place_from_response(response.json())
+                    except (ValueError, AttributeError, TypeError) as e:
+                        # A captive portal or proxy error page, or JSON that is not an address
+                        raise GeocodingError(f"Unreadable location data: {e}") from None
+                error = f"Unable to fetch location data. Status code: {response.status_code}"
+                if response.status_code not in RETRY_STATUSES:
+                    raise GeocodingError(error)
+                retry_after = _retry_after_seconds(response)
+
+            if attempt < self.max_retries:
+                backoff = min(BACKOFF_SECONDS * 2 ** attempt, MAX_BACKOFF_SECONDS)
+                time.sleep(retry_after if retry_after is not None else backoff)
+        raise GeocodingError(error)
+
+    def submit(self, lat, lon):
+        return self.executor.submit(self.reverse, lat, lon)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+class SelfHostedNominatimBackend(NominatimBackend):
+    """A private Nominatim instance, which is not bound by the public server's usage policy"""
+    name = 'self_hosted'
+
+    def __init__(self, base_url=SELF_HOSTED_NOMINATIM_URL, rate_per_second=SELF_HOSTED_RATE_PER_SECOND,
+                 concurrency=SELF_HOSTED_CONCURRENCY, **kwargs):
+        super().__init__(base_url, rate_per_second, concurrency=concurrency, **kwargs)
+
+BACKENDS = {backend.name: backend for backend in (OfflineBackend, NominatimBackend, SelfHostedNominatimBackend)}
+
+def create_backend(name, **kwargs):
+    """Build a backend by name; kwargs such as base_url go to its constructor"""
+    try:
+        return BACKENDS[name](**kwargs)
+    except KeyError:
+        raise ValueError(f"Unknown geocoder backend: {name}") from None
+
+def _place_from_response(data):
+    address = data.get('address') or {}
+    if not address:
+        return None
+    city = address.get('city') or address.get('town') or address.get('village') or address.get('municipality')
+    suburb = address.get('suburb') or address.get('neighbourhood') or address.get('quarter')
+    return Place(address.get('country'), address.get('country_code', '').upper() or None, address.get('state'),
+                 address.get('county'), city or address.get('county'), suburb)
+
+def _retry_after_seconds(response):
+    try:
+        return min(float(response.headers.get('Retry-After')), MAX_BACKOFF_SECONDS)
+    except (TypeError, ValueError):
+        return None
+
+def get_geocoder_backend():
+    """The process-wide online backend, so every operation shares one connection pool and rate limit"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend(GEOCODER_BACKEND)
+        return _backend
@@ -0,0 +1,118 @@
+from constants import GEOFENCES_PATH, GEOFENCE_CELL_DEGREES, GEOFENCE_MAX_CELLS
+from location_clusters import METERS_PER_DEGREE
+from boundary_resolver import Ring
+import json
+import math
+import os
+
+class CircleFence:
+    def __init__(self, name, lat, lon, radius_m):
+        self.name = name
+        self.lat = lat
+        self.lon = lon
+        self.radius_m = radius_m
+        self.scale = max(math.cos(math.radians(lat)), 0.01)
+        lat_reach = radius_m / METERS_PER_DEGREE
+        lon_reach = lat_reach / self.scale
+        self.bbox = (lon - lon_reach, lat - lat_reach, lon + lon_reach, lat + lat_reach)
+        self.area = math.pi * radius_m ** 2
+
+    def contains(self, lat, lon):
+        distance = math.hypot(self.lat - lat, (self.lon - lon) * self.scale) * METERS_PER_DEGREE
+        return distance <= self.radius_m
+
+class PolygonFence:
+    def __init__(self, name, points):
+        self.name = name
+        self.ring = Ring([(lon, lat) for lat, lon in points])
+        self.bbox = self.ring.bbox
+        # Shoelace area, in square metres near enough to rank overlapping fences
+        scale = max(math.cos(math.radians((self.bbox[1] + self.bbox[3]) / 2)), 0.01)
+        self.area = abs(sum(lon1 * lat2 - lon2 * lat1 for (lat1, lon1), (lat2, lon2)
+                            in zip(points, points[1:] + points[:1]))) / 2 * scale * METERS_PER_DEGREE ** 2
+
+    def contains(self, lat, lon):
+        x1, y1, x2, y2 = self.bbox
+        return x1 <= lon <= x2 and y1 <= lat <= y2 and self.ring.crossings(lon, lat)
+
+class GeofenceIndex:
+    """Named places of the user's own, found through a fixed grid of small cells.
+
+    Each fence is listed in every cell its bounding box touches, so a point
+    only tests the handful of fences near it however many are defined. Fences
+    too big for the grid are kept aside and tested by bounding box. Where
+    fences overlap the smallest one wins, so an office inside a campus is
+    named after the office.
+    """
+
+    def __init__(self, fences, cell_degrees=GEOFENCE_CELL_DEGREES, max_cells=GEOFENCE_MAX_CELLS):
+        self.fences = sorted(fences, key=lambda fence: fence.area)
+        self.cell_degrees = cell_degrees
+        self.grid = {}
+        self.large = []
+        for fence in self.fences:
+            x1, y1, x2, y2 = fence.bbox
+            rows = range(self._cell(y1), self._cell(y2) + 1)
+            cols = range(self._cell(x1), self._cell(x2) + 1)
+            if len(rows) * len(cols) > max_cells:
+                self.large.append(fence)
+                continue
+            for row in rows:
+                for col in cols:
+                    self.grid.setdefault((row, col), []).append(fence)
+
+    def __len__(self):
+        return len(self.fences)
+
+    def _cell(self, degrees):
+        return math.floor(degrees / self.cell_degrees)
+
+    def match(self, lat, lon):
+        """Return the name of the smallest fence containing the point, or None"""
+        found = None
+        for fence in self.grid.get((self._cell(lat), self._cell(lon)), ()):
+            if fence.contains(lat, lon):
+                found = fence
+                break
+        for fence in self.large:
+            if found is not None and fence.area >= found.area:
+                break
+            if fence.contains(lat, lon):
+                found = fence
+                break
+        return found.name if found else None
+
+def parse_geofence(entry):
+    """Build a fence from one settings entry; raises ValueError if it is malformed"""
+    try:
+        name = str(entry['name']).strip()
+        if not name:
+            raise ValueError("a geofence needs a name")
+        if 'radius_m' in entry:
+            lat, lon = (float(value) for value in entry['center'])
+            return CircleFence(name, lat, lon, float(entry['radius_m']))
+        points = [(float(lat), float(lon)) for lat, lon in entry['points']]
+        if len(points) < 3:
+            raise ValueError(f"polygon {name} needs at least 3 points")
+        return PolygonFence(name, points)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"malformed geofence {entry!r}: {e}") from None
+
+def load_geofences(path=GEOFENCES_PATH):
+    """Compile the geofences settings file into an index; None when there are no fences"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f).get('geofences', [])
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"Error loading geofences: {e}")
+        return None
+
+    fences = []
+    for entry in entries:
+        try:
+            fences.append(parse_geofence(entry))
+        except ValueError as e:
+            print(f"Error loading geofences: {e}")
+    return GeofenceIndex(fences) if fences else None
@@ -3,16 +3,22 @@ from PyQt5.QtWidgets import (
     QProgressBar, QTextEdit, QLabel, QLineEdit, QFrame, QScrollArea, QDesktopWidget, 
     QDialog, QStackedLayout, QMessageBox, QMenu
 )
-from PyQt5.QtCore import Qt, QPropertyAnimation, QEasingCurve, QSize, QPoint, QUrl, QThread, pyqtSignal
-from workers import SortByLocThread, FlattenFolderThread, SortByTimeThread, MapGenerationThread
-from constants import IMAGE_FORMATS, VIDEO_FORMATS, SUPPORTED_MEDIA_FORMATS
+from PyQt5.QtCore import Qt, QPropertyAnimation, QEasingCurve, QSize, QPoint, QUrl, QThread, QTimer, pyqtSignal
+from workers import (SortByLocThread, FlattenFolderThread, SortByTimeThread, MapGenerationThread, PrefetchThread,
+                     ResumeMovesThread, UndoThread)
+from move_journal import MoveJournal, open_journal, latest_unfinished_journal, latest_undoable_journal
+from move_plan import MovePlan
+from file_scanner import scan_files, has_files
+from exiftool_pool import ExifToolPool, exiftool_session
+from metadata_cache import open_metadata_cache
+from heif_reader import register_heif_opener_once
+from constants import IMAGE_FORMATS, VIDEO_FORMATS, SUPPORTED_MEDIA_FORMATS, PREFETCH_DELAY_MS
 from PyQt5.QtGui import QFont, QIcon, QImage, QPainter, QColor, QPixmap
 from PyQt5.QtWebEngineWidgets import QWebEngineView
 from theme_manager import ThemeManager
 from typing import Dict, List, Tuple
 from PIL import Image
 import tempfile
-import exiftool
 import hashlib
 import piexif
 import shutil
@@ -179,12 +185,13 @@ class SettingsDialog(QDialog):
         super().__init__(parent)
         self.hide()
         self.setWindowModality(Qt.ApplicationModal)
-        self.setFixedSize(300, 250)
+        self.setFixedSize(300, 310)
         
         self.scroll_area = None
         self.main_title = None
         self.theme_title = None
         self.theme_button = None
+        self.clear_cache_button = None
         self.back_button = None
         self.exit_button = None
         self.theme_buttons = {}
@@ -223,6 +230,13 @@ class SettingsDialog(QDialog):
         
         layout.addSpacing(20)
         
+        self.clear_cache_button = QPushButton("Clear Cache")
+        self.clear_cache_button.setFixedSize(150, 40)
+        self.clear_cache_button.clicked.connect(self.clear_cache)
+        layout.addWidget(self.clear_cache_button, alignment=Qt.AlignCenter)
+        
+        layout.addSpacing(20)
+        
         self.exit_button = QPushButton("Exit Program")
         self.exit_button.setFixedSize(150, 40)
         self.exit_button.clicked.connect(self.parent().close)
@@ -303,6 +317,20 @@ class SettingsDialog(QDialog):
         self.stacked_layout.setCurrentWidget(self.main_settings_widget)
         self.animation.start()
     
+    def clear_cache(self):
+        """Forget all cached file metadata so the next operation re-reads every file"""
+        cache = open_metadata_cache()
+        if cache is None:
+            self.parent().show_error("Error opening the metadata cache")
+            return
+        try:
+            cache.clear()
+            QMessageBox.information(self, "Cache Cleared", "Cached file metadata has been cleared.")
+        except Exception as e:
+            self.parent().show_error(f"Error clearing cache: {str(e)}")
+        finally:
+            cache.close()
+
     def change_theme(self, theme_id):
         try:
             theme_data = ThemeManager.get_available_themes()[theme_id]
@@ -406,6 +434,9 @@ class SettingsDialog(QDialog):
         if self.theme_button:
             self.theme_button.setStyleSheet(main_button_style)
         
+        if self.clear_cache_button:
+            self.clear_cache_button.setStyleSheet(main_button_style)
+        
         if self.back_button:
             self.back_button.setStyleSheet(f"""
                 QPushButton {{
@@ -447,17 +478,17 @@ class DuplicateFinderThread(QThread):
         self.folder_path = folder_path
         self.action = action
         self.chunk_size = 8192
+        self.journal = None
     
     def has_files_to_process(self) -> bool:
         try:
-            files = [f for f in os.listdir(self.folder_path) 
-                    if os.path.isfile(os.path.join(self.folder_path, f))]
+            file_count = sum(1 for _ in scan_files(self.folder_path, max_depth=0))
             
-            if not files:
+            if not file_count:
                 self.update_output.emit("No files found in the selected folder.")
                 return False
                 
-            self.update_output.emit(f"Found {len(files)} files to check for duplicates.")
+            self.update_output.emit(f"Found {file_count} files to check for duplicates.")
             return True
             
         except Exception as e:
@@ -484,17 +515,18 @@ class DuplicateFinderThread(QThread):
         hash_dict: Dict[str, List[str]] = {}
         
         try:
-            files = [f for f in os.listdir(self.folder_path) 
-                    if os.path.isfile(os.path.join(self.folder_path, f))]
+            # The listing's own entries carry the sizes, so grouping them costs no extra lookups on Windows
+            files = list(scan_files(self.folder_path, max_depth=0))
             total_files = len(files)
             processed_files = 0
             
             size_dict: Dict[int, List[str]] = {}
             
-            for filename in files:
-                file_path = os.path.join(self.folder_path, filename)
+            for entry in files:
+                file_path = entry.path
+                filename = entry.name
                 try:
-                    file_size = os.path.getsize(file_path)
+                    file_size = entry.stat().st_size
                     if file_size in size_dict:
                         size_dict[file_size].append(file_path)
                     else:
@@ -533,30 +565,28 @@ class DuplicateFinderThread(QThread):
         handled_count = 0
         
         if self.action == 'move':
+            # Moves are journaled, so they can be undone later
             duplicate_dir = os.path.join(self.folder_path, "Duplicates")
-            os.makedirs(duplicate_dir, exist_ok=True)
-        
+            plan = MovePlan()
+            for file_list in duplicates.values():
+                # Keep the first file, handle all others
+                for duplicate in file_list[1:]:
+                    plan.add(duplicate, duplicate_dir, keep_both=True)
+            self.journal = open_journal('duplicates', self.folder_path)
+            for move, error in plan.execute(self.journal):
+                if error:
+                    self.update_output.emit(f"Error handling duplicate {move.source}: {str(error)}")
+                else:
+                    self.update_output.emit(f"Moved duplicate: {move.source} → {move.target}")
+                    handled_count += 1
+            return total_duplicates, handled_count
+
         for hash_value, file_list in duplicates.items():
             # Keep the first file, handle all others
-            original = file_list[0]
             for duplicate in file_list[1:]:
                 try:
-                    if self.action == 'move':
-                        original_name = os.path.basename(duplicate)
-                        new_path = os.path.join(duplicate_dir, original_name)
-                        
-                        # If a file with this name already exists, add a number
-                        counter = 1
-                        while os.path.exists(new_path):
-                            base_name, ext = os.path.splitext(original_name)
-                            new_path = os.path.join(duplicate_dir, f"{base_name} ({counter}){ext}")
-                            counter += 1
-                            
-                        shutil.move(duplicate, new_path)
-                        self.update_output.emit(f"Moved duplicate: {duplicate} → {new_path}")
-                    else:
-                        os.remove(duplicate)
-                        self.update_output.emit(f"Deleted duplicate: {duplicate}")
+                    os.remove(duplicate)
+                    self.update_output.emit(f"Deleted duplicate: {duplicate}")
                     handled_count += 1
                 except Exception as e:
                     self.update_output.emit(f"Error handling duplicate {duplicate}: {str(e)}")
@@ -584,6 +614,8 @@ class DuplicateFinderThread(QThread):
             self.update_output.emit(f"Total duplicate files found: {total_dupes}")
             self.update_output.emit(f"Duplicates {self.action}d: {handled_dupes}")
             
+            if self.journal:
+                self.journal.finish()
             if self.action == 'move':
                 self.update_output.emit("\nDuplicate files have been moved to the 'Duplicates' folder.")
                 self.update_output.emit("Please review before deleting.")
@@ -591,6 +623,8 @@ class DuplicateFinderThread(QThread):
         except Exception as e:
             self.update_output.emit(f"Error during duplicate handling: {str(e)}")
         finally:
+            if self.journal:
+                self.journal.close()
             self.finished.emit()
 
 class DuplicateHandlerDialog(QDialog):
@@ -691,9 +725,10 @@ class DuplicateHandlerDialog(QDialog):
                 """)
 
 class MetadataRemoverDialog(QDialog):
-    def __init__(self, file_path, parent=None):
+    def __init__(self, file_path, parent=None, exiftool_pool=None):
         super().__init__(parent)
         self.file_path = file_path
+        self.exiftool_pool = exiftool_pool
         self.current_theme = self.parent().current_theme
         self.setWindowFlags(Qt.Dialog | Qt.WindowTitleHint | Qt.WindowCloseButtonHint)
         self.backup_path = None
@@ -763,6 +798,7 @@ class MetadataRemoverDialog(QDialog):
             
             if file_extension in IMAGE_FORMATS:
                 try:
+                    register_heif_opener_once()
                     with Image.open(self.file_path) as img:
                         if img.mode in ('RGBA', 'LA'):
                             background = Image.new('RGB', img.size, (255, 255, 255))
@@ -789,7 +825,7 @@ class MetadataRemoverDialog(QDialog):
             elif file_extension in VIDEO_FORMATS:
                 # Handle video files using exiftool
                 try:
-                    with exiftool.ExifToolHelper() as et:
+                    with exiftool_session(self.exiftool_pool) as et:
                         et.execute('-overwrite_original', '-all=', '-tagsfromfile', '@', 'ColorSpaceTags', self.file_path)
                 except Exception as e:
                     raise Exception(f"Error removing video metadata: {str(e)}")
@@ -823,6 +859,7 @@ class MetadataRemoverDialog(QDialog):
                 scaled_pixmap = pixmap.scaled(400, 400, Qt.KeepAspectRatio, Qt.SmoothTransformation)
                 self.image_label.setPixmap(scaled_pixmap)
                 
+                register_heif_opener_once()
                 with Image.open(self.file_path) as img:
                     metadata = self.extract_image_metadata(img)
                     formatted_metadata = self.format_metadata(metadata)
@@ -838,7 +875,7 @@ class MetadataRemoverDialog(QDialog):
             
             # Extract metadata using exiftool for videos
             try:
-                with exiftool.ExifToolHelper() as et:
+                with exiftool_session(self.exiftool_pool) as et:
                     metadata = et.get_metadata(self.file_path)[0]
                     
                     # Organize video metadata
@@ -1338,11 +1375,22 @@ class MediaGPSExtractorGUI(QMainWindow):
         self.windowed_size = QSize(800, 600)
         self.current_worker = None
         self.files_processed = False
+        self.exiftool_pool = ExifToolPool()
+        self.prefetch_worker = None
+        # Interrupted prefetches finishing their current batch in the background
+        self.stopping_prefetches = []
+        # Restarted on every edit, so typing a path prefetches only the final folder
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(PREFETCH_DELAY_MS)
+        self.prefetch_timer.timeout.connect(self.start_prefetch)
         
         self.settings_dialog = SettingsDialog(self)
         
         self.initUI()
         self.apply_theme_colors(self.current_theme)
+        # Once the window is up, offer to finish anything a crash left half done
+        QTimer.singleShot(0, self.offer_resume)
 
     def initUI(self):
         self.setWindowTitle('PicPoint')
@@ -1390,6 +1438,7 @@ class MediaGPSExtractorGUI(QMainWindow):
         self.folder_input = QLineEdit()
         self.folder_input.setPlaceholderText("Select a folder")
         self.folder_input.setFixedHeight(40)
+        self.folder_input.textChanged.connect(self.schedule_prefetch)
         folder_layout.addWidget(self.folder_input)
         
         browse_button = QPushButton('Browse')
@@ -1416,6 +1465,10 @@ class MediaGPSExtractorGUI(QMainWindow):
         flatten_button.clicked.connect(self.flatten_folder)
         button_layout_1.addWidget(flatten_button)
 
+        undo_button = ModernButton('Undo Last Operation', 'assets/icons/back_icon.png')
+        undo_button.clicked.connect(self.undo_last_operation)
+        button_layout_1.addWidget(undo_button)
+
         card_layout.addLayout(button_layout_1)
 
         # Action buttons section - Second row
@@ -1584,27 +1637,81 @@ class MediaGPSExtractorGUI(QMainWindow):
         if folder:
             self.folder_input.setText(folder)
 
+    def schedule_prefetch(self):
+        self.cancel_prefetch()
+        self.prefetch_timer.start()
+
+    def start_prefetch(self):
+        """Read the chosen folder in the background while the user decides what to do with it"""
+        folder_path = self.folder_input.text()
+        if not os.path.isdir(folder_path) or (self.current_worker and self.current_worker.isRunning()):
+            return
+        self.prefetch_worker = PrefetchThread(folder_path, self.exiftool_pool)
+        self.prefetch_worker.start(QThread.IdlePriority)
+
+    def cancel_prefetch(self):
+        """Interrupt a background prefetch without waiting; it stops after its current batch"""
+        self.prefetch_timer.stop()
+        worker = self.prefetch_worker
+        if worker:
+            self.prefetch_worker = None
+            worker.requestInterruption()
+            self.stopping_prefetches.append(worker)
+            worker.finished.connect(lambda: self.prefetch_stopped(worker))
+            if worker.isFinished():
+                self.prefetch_stopped(worker)
+
+    def prefetch_stopped(self, worker):
+        if worker in self.stopping_prefetches:
+            self.stopping_prefetches.remove(worker)
+            worker.deleteLater()
+
+    def stop_prefetch(self):
+        """Stop background prefetches so a real operation has the files and caches to itself"""
+        self.cancel_prefetch()
+        for worker in list(self.stopping_prefetches):
+            worker.wait()
+            self.prefetch_stopped(worker)
+
+    def offer_resume(self):
+        journal = latest_unfinished_journal()
+        if journal is None:
+            return
+
+        moved = len(journal.moves) - len(journal.remaining())
+        answer = QMessageBox.question(
+            self,
+            "Resume Operation",
+            f"{journal.label} of {journal.folder} stopped after {moved} of {len(journal.moves)} "
+            f"files were moved.\n\nFinish it now?",
+            QMessageBox.Yes | QMessageBox.No
+        )
+        if answer != QMessageBox.Yes:
+            MoveJournal(journal.path).abandon()
+            return
+
+        self.folder_input.setText(journal.folder)
+        if not self.check_and_prepare_operation():
+            return
+        self.current_worker = ResumeMovesThread(journal)
+        self.current_worker.update_progress.connect(self.update_progress)
+        self.current_worker.update_output.connect(self.update_output)
+        self.current_worker.finished.connect(lambda: self.operation_finished(""))
+        self.current_worker.start()
+
     def sort_by_loc(self, is_additional_sort=False):
         if not self.check_and_prepare_operation():
             return
 
         self.files_processed = False
         folder_path = self.folder_input.text()
-        self.current_worker = SortByLocThread(folder_path, is_additional_sort)
+        self.current_worker = SortByLocThread(folder_path, is_additional_sort, self.exiftool_pool)
         self.current_worker.update_progress.connect(self.update_progress)
         self.current_worker.update_output.connect(self.update_output)
         self.current_worker.finished.connect(lambda: self.sort_loc_finished(not is_additional_sort))
         self.current_worker.file_processed.connect(self.set_files_processed)
-        self.current_worker.internet_check_failed.connect(self.handle_internet_check_failed)
         self.current_worker.start()
 
-    def handle_internet_check_failed(self):
-        """Handle the case when internet check fails"""
-        self.cleanup_worker()
-        self.status_label.setText("Ready")
-        self.status_label.setStyleSheet(f"color: {self.current_theme['secondary_text']}; margin-top: 5px;")
-        self.progress_bar.setValue(0)
-
     def flatten_finished(self):
         self.operation_finished("")
 
@@ -1614,7 +1721,7 @@ class MediaGPSExtractorGUI(QMainWindow):
 
         self.files_processed = False
         folder_path = self.folder_input.text()
-        self.current_worker = SortByTimeThread(folder_path, is_additional_sort)
+        self.current_worker = SortByTimeThread(folder_path, is_additional_sort, self.exiftool_pool)
         self.current_worker.update_progress.connect(self.update_progress)
         self.current_worker.update_output.connect(self.update_output)
         self.current_worker.finished.connect(lambda: self.sort_time_finished(not is_additional_sort))
@@ -1632,11 +1739,11 @@ class MediaGPSExtractorGUI(QMainWindow):
             self.show_error("Map SVG files not found")
             return
 
-        self.current_worker = MapGenerationThread(self.folder_input.text(), us_svg_path, world_svg_path)
+        self.current_worker = MapGenerationThread(self.folder_input.text(), us_svg_path, world_svg_path,
+                                                  self.exiftool_pool)
         self.current_worker.update_progress.connect(self.update_progress)
         self.current_worker.update_output.connect(self.update_output)
         self.current_worker.finished.connect(self.map_generation_finished)
-        self.current_worker.internet_check_failed.connect(self.handle_internet_check_failed)
         self.current_worker.start()
 
     def map_generation_finished(self, us_states, world_countries, us_svg, world_svg):
@@ -1657,10 +1764,7 @@ class MediaGPSExtractorGUI(QMainWindow):
             
         # Check if there are any files to process first
         try:
-            files = [f for f in os.listdir(self.folder_input.text()) 
-                    if os.path.isfile(os.path.join(self.folder_input.text(), f))]
-            
-            if not files:
+            if not has_files(self.folder_input.text(), max_depth=0):
                 self.output_area.clear()
                 self.update_output("No files found in the selected folder.")
                 return
@@ -1705,7 +1809,7 @@ class MediaGPSExtractorGUI(QMainWindow):
         
         if file_path:
             try:
-                dialog = MetadataRemoverDialog(file_path, self)
+                dialog = MetadataRemoverDialog(file_path, self, self.exiftool_pool)
                 dialog.exec_()
             except Exception as e:
                 self.show_error(f"Error removing metadata: {str(e)}")
@@ -1724,6 +1828,7 @@ class MediaGPSExtractorGUI(QMainWindow):
             self.show_error("An operation is already in progress")
             return False
 
+        self.stop_prefetch()
         self.cleanup_worker()
         self.output_area.clear()
         self.progress_bar.setValue(0)
@@ -1754,6 +1859,36 @@ class MediaGPSExtractorGUI(QMainWindow):
             self.progress_bar.setValue(0)
             self.sort_by_time(is_additional_sort=True)
 
+    def undo_last_operation(self):
+        """Move the files of the newest sort, flatten or duplicate move back where they were"""
+        if self.current_worker and self.current_worker.isRunning():
+            self.show_error("An operation is already in progress")
+            return
+
+        journal = latest_undoable_journal()
+        if journal is None:
+            self.show_error("There is no operation to undo")
+            return
+
+        answer = QMessageBox.question(
+            self,
+            "Undo Operation",
+            f"Undo {journal.label.lower()} of {journal.folder}?\n\n"
+            f"{len(journal.done)} files will be moved back where they were.",
+            QMessageBox.Yes | QMessageBox.No
+        )
+        if answer != QMessageBox.Yes:
+            return
+
+        self.folder_input.setText(journal.folder)
+        if not self.check_and_prepare_operation():
+            return
+        self.current_worker = UndoThread(journal)
+        self.current_worker.update_progress.connect(self.update_progress)
+        self.current_worker.update_output.connect(self.update_output)
+        self.current_worker.finished.connect(lambda: self.operation_finished(""))
+        self.current_worker.start()
+
     def flatten_folder(self):
         """Handle the flatten folder operation"""
         if not self.check_and_prepare_operation():
@@ -1786,7 +1921,9 @@ class MediaGPSExtractorGUI(QMainWindow):
         self.cleanup_worker()
 
     def closeEvent(self, event):
+        self.stop_prefetch()
         self.cleanup_worker()
+        self.exiftool_pool.shutdown()
         super().closeEvent(event)
 
     def apply_theme_colors(self, colors):
@@ -0,0 +1,36 @@
+from exif_reader import read_exif_header, parse_exif_block
+import pillow_heif
+import threading
+
+_heif_registered = False
+_heif_lock = threading.Lock()
+
+def register_heif_opener_once():
+    """Register the HEIF plugin with Pillow the first time anything needs it"""
+    global _heif_registered
+    if _heif_registered:
+        return
+    with _heif_lock:
+        if not _heif_registered:
+            pillow_heif.register_heif_opener()
+            _heif_registered = True
+
+def read_heif_header(file_path):
+    """Read GPS, capture time and size of a HEIC file without decoding any image tiles.
+
+    The Exif item is located through the ISOBMFF iinf/iloc boxes; files that layout
+    does not cover go through pillow_heif's metadata API, which also stops short of
+    decoding. Returns the same dict as read_exif_header, or None if neither works.
+    """
+    header = read_exif_header(file_path)
+    if header is not None:
+        return header
+
+    try:
+        heif_file = pillow_heif.open_heif(file_path, convert_hdr_to_8bit=False)
+        header = parse_exif_block(heif_file.info.get('exif') or b"")
+        header['width'], header['height'] = heif_file.size
+        return header
+    except Exception as e:
+        print(f"Error reading HEIF metadata: {e}")
+        return None
@@ -0,0 +1,60 @@
+from constants import GEOCODE_CLUSTER_RADIUS_M
+from typing import List, NamedTuple, Tuple
+import math
+
+METERS_PER_DEGREE = 111195
+
+class Cluster(NamedTuple):
+    """Points close enough to share one geocoding answer"""
+    center: Tuple[float, float]
+    members: List[int]
+
+class ClusterIndex:
+    """Clusters built up one point at a time, so work can start as soon as a new place appears.
+
+    Each point joins the nearest cluster whose center lies within radius_m, or
+    starts a new cluster centered on itself. Unlike DBSCAN, clusters cannot
+    chain along a street into one huge group: every member is within radius_m
+    of the center, which is a real photo location. Centers are found through
+    a grid of radius-sized cells, so adding a point takes constant time.
+    """
+
+    def __init__(self, radius_m=GEOCODE_CLUSTER_RADIUS_M):
+        self.radius_m = radius_m
+        self.cell_degrees = max(radius_m, 1) / METERS_PER_DEGREE
+        self.clusters = []
+        self.grid = {}
+        self.count = 0
+
+    def add(self, lat, lon):
+        """Add a point; return (cluster index, whether the point started a new cluster)"""
+        index = self.count
+        self.count += 1
+        row, col = math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+        scale = max(math.cos(math.radians(lat)), 0.01)
+        # Longitude degrees shrink towards the poles, so more columns are within reach there
+        col_reach = math.ceil(1 / scale)
+
+        best, best_distance = None, self.radius_m
+        for cell_row in (row - 1, row, row + 1):
+            for cell_col in range(col - col_reach, col + col_reach + 1):
+                for cluster_index in self.grid.get((cell_row, cell_col), ()):
+                    center_lat, center_lon = self.clusters[cluster_index].center
+                    distance = math.hypot(center_lat - lat, (center_lon - lon) * scale) * METERS_PER_DEGREE
+                    if distance <= best_distance:
+                        best, best_distance = cluster_index, distance
+
+        is_new = best is None
+        if is_new:
+            best = len(self.clusters)
+            self.clusters.append(Cluster((lat, lon), []))
+            self.grid.setdefault((row, col), []).append(best)
+        self.clusters[best].members.append(index)
+        return best, is_new
+
+def cluster_points(points, radius_m=GEOCODE_CLUSTER_RADIUS_M):
+    """Group [(lat, lon), ...] into Clusters of indexes into points; see ClusterIndex"""
+    index = ClusterIndex(radius_m)
+    for lat, lon in points:
+        index.add(lat, lon)
+    return index.clusters
@@ -0,0 +1,95 @@
+from contextlib import contextmanager
+import struct
+import mmap
+import os
+
+READ_BLOCK_SIZE = 4096
+# Below this a couple of buffered reads are cheaper than setting up a mapping
+MMAP_MIN_BYTES = 1024 * 1024
+
+@contextmanager
+def open_window(file_path):
+    """Open a file for positioned reads: memory mapped when it is large, buffered otherwise"""
+    with open(file_path, 'rb') as f:
+        window = None
+        if os.fstat(f.fileno()).st_size >= MMAP_MIN_BYTES:
+            try:
+                window = MappedWindow(f)
+            except (OSError, ValueError):
+                # Some filesystems and pipes cannot be mapped
+                window = None
+        if window is None:
+            yield FileWindow(f)
+            return
+        try:
+            yield window
+        finally:
+            window.close()
+
+class FileWindow:
+    """Serve small positioned reads from a file, refilling a single block buffer"""
+
+    def __init__(self, f, block_size=READ_BLOCK_SIZE):
+        self.f = f
+        self.block_size = block_size
+        self.start = 0
+        self.data = b""
+
+    def read_at(self, offset, size):
+        end = offset + size
+        if offset < self.start or end > self.start + len(self.data):
+            self.f.seek(offset)
+            self.start = offset
+            self.data = self.f.read(max(size, self.block_size))
+        return self.data[offset - self.start:end - self.start]
+
+class MappedWindow:
+    """Positioned reads that slice a read-only memory map instead of copying"""
+
+    def __init__(self, f):
+        self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+
+    def read_at(self, offset, size):
+        return self.view[offset:offset + size]
+
+    def close(self):
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # A slice is still referenced somewhere; the map is unmapped when it is collected
+            pass
+
+class BytesWindow:
+    """Positioned reads over an in-memory block"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def read_at(self, offset, size):
+        return self.data[offset:offset + size]
+
+def iter_boxes(window, offset, end):
+    """Yield (type, payload_start, box_end) for consecutive ISOBMFF boxes"""
+    while end is None or offset + 8 <= end:
+        header = window.read_at(offset, 16)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header[:8])
+        header_size = 8
+        if size == 1:
+            if len(header) < 16:
+                return
+            size = struct.unpack('>Q', header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            if end is None:
+                # Box runs to the end of the file; we cannot size it without a stat
+                yield box_type, offset + header_size, offset + header_size
+                return
+            size = end - offset
+        if size < header_size:
+            return
+        yield box_type, offset + header_size, offset + size
+        offset += size
@@ -0,0 +1,252 @@
+from constants import (IMAGE_FORMATS, VIDEO_FORMATS, QUICKTIME_FORMATS, EXIFTOOL_BATCH_SIZE,
+                       EXTRACTION_WORKERS, EXTRACTION_CHUNK_SIZE)
+from concurrent.futures import ProcessPoolExecutor, Future
+from exiftool_pool import ExifToolPool
+from collections import deque
+from utils import (GPS_TAGS, DATE_TAGS, iter_exiftool_metadata, gps_from_metadata,
+                   date_from_metadata, read_image_header)
+from heif_reader import register_heif_opener_once
+from quicktime_reader import read_quicktime_header
+from typing import NamedTuple, Optional, Tuple
+from datetime import datetime
+from PIL import Image
+import multiprocessing
+import os
+
+VIDEO_TAGS = GPS_TAGS + DATE_TAGS + ['QuickTime:ImageWidth', 'QuickTime:ImageHeight']
+
+# ExifTool process owned by each extraction worker process
+_process_exiftool_pool = None
+
+class MediaRecord(NamedTuple):
+    """Everything the sort and map operations need to know about one file"""
+    path: str
+    media_type: str  # 'image', 'video' or 'other'
+    gps: Optional[Tuple[float, float]]
+    capture_time: Optional[datetime]
+    time_source: Optional[str]  # 'exif', 'metadata' or 'mtime'
+    width: Optional[int]
+    height: Optional[int]
+    size: Optional[int]
+    mtime: Optional[float]
+
+def get_media_type(file_path):
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in IMAGE_FORMATS:
+        return 'image'
+    if extension in VIDEO_FORMATS:
+        return 'video'
+    return 'other'
+
+def extract_media_record(file_path, exiftool_pool=None):
+    """Build the record for a single file"""
+    return next(iter_media_records([file_path], exiftool_pool))
+
+def iter_media_records(file_paths, exiftool_pool=None, max_workers=EXTRACTION_WORKERS,
+                       batch_size=EXIFTOOL_BATCH_SIZE, cache=None):
+    """Yield a MediaRecord per path in input order, opening each file at most once.
+
+    Images and MP4/MOV files are read from their headers one by one; the videos that
+    are left without an answer are collected per window and read with one batched
+    ExifTool request. With max_workers > 1 full chunks are extracted in a process pool,
+    with at most two chunks per worker in flight so memory stays flat however many
+    files are queued. Files found in the MetadataCache only cost a stat; records whose
+    ExifTool read failed are yielded but not cached, so they are read again next time.
+    """
+    chunk_size = EXTRACTION_CHUNK_SIZE if max_workers > 1 else batch_size
+    executor = None
+    pending = deque()
+    try:
+        for chunk in _iter_chunks(file_paths, chunk_size):
+            cached, stats = cache.lookup_many(chunk) if cache is not None else ({}, {})
+            misses = [file_path for file_path in chunk if file_path not in cached]
+
+            if not misses:
+                job = ([], set())
+            elif max_workers > 1 and len(misses) >= chunk_size // 2:
+                if executor is None:
+                    # Spawned, not forked: this runs in a QThread while other threads hold locks
+                    executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_extraction_worker,
+                                                   mp_context=multiprocessing.get_context('spawn'))
+                job = executor.submit(_extract_chunk, misses)
+            else:
+                # Short or mostly cached chunks are not worth a trip to a worker process
+                job = _extract_window(misses, exiftool_pool, batch_size)
+            pending.append((chunk, cached, stats, job))
+
+            while pending and (len(pending) >= max_workers * 2 or _is_ready(pending[0][3])):
+                yield from _merge_chunk(pending.popleft(), cache)
+
+        while pending:
+            yield from _merge_chunk(pending.popleft(), cache)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+def _is_ready(job):
+    return not isinstance(job, Future) or job.done()
+
+def _merge_chunk(entry, cache):
+    chunk, cached, stats, job = entry
+    extracted, unfinished = job.result() if isinstance(job, Future) else job
+    if cache is not None and extracted:
+        cache.store_many([record for record in extracted if record.path not in unfinished], stats)
+
+    records = {record.path: record for record in extracted}
+    records.update(cached)
+    for file_path in chunk:
+        yield records[file_path]
+
+def _init_extraction_worker():
+    global _process_exiftool_pool
+    # The ExifTool process exits by itself once the worker's pipe closes
+    _process_exiftool_pool = ExifToolPool(size=1)
+
+def _extract_chunk(file_paths):
+    return _extract_window(file_paths, _process_exiftool_pool, EXIFTOOL_BATCH_SIZE)
+
+def _iter_chunks(file_paths, size):
+    chunk = []
+    for file_path in file_paths:
+        chunk.append(file_path)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _extract_window(window, exiftool_pool, batch_size):
+    """Return the window's records and the paths whose ExifTool read failed, leaving them on fallbacks"""
+    images = {}
+    video_headers = {}
+    for file_path in window:
+        media_type = get_media_type(file_path)
+        if media_type == 'image':
+            images[file_path] = _read_image(file_path)
+        elif media_type == 'video':
+            video_headers[file_path] = _read_video_header(file_path)
+
+    # Images without an EXIF capture date, such as PNGs, fall back to ExifTool's date tags before mtime
+    image_dates = {}
+    undated = [file_path for file_path, image in images.items() if image[1] is None]
+    unfinished = set(undated)
+    if undated:
+        try:
+            for file_path, metadata in iter_exiftool_metadata(undated, DATE_TAGS, exiftool_pool, batch_size):
+                image_dates[file_path] = date_from_metadata(metadata)
+                unfinished.discard(file_path)
+        except Exception as e:
+            print(f"An error occurred: {str(e)}")
+
+    # Only videos the native parser could not fully answer cost an ExifTool round trip. A video
+    # without GPS whose moov holds no location atom is answered: most cameras never record one
+    videos = [file_path for file_path, header in video_headers.items()
+              if header['creation_time'] is None or (header['gps'] is None and header['gps_atom'])]
+    unfinished.update(videos)
+    if videos:
+        try:
+            for file_path, metadata in iter_exiftool_metadata(videos, VIDEO_TAGS, exiftool_pool, batch_size):
+                unfinished.discard(file_path)
+                header = video_headers[file_path]
+                header['gps'] = header['gps'] or gps_from_metadata(metadata)
+                header['creation_time'] = header['creation_time'] or date_from_metadata(metadata)
+                header['width'] = header['width'] or _int_or_none(metadata.get('QuickTime:ImageWidth'))
+                header['height'] = header['height'] or _int_or_none(metadata.get('QuickTime:ImageHeight'))
+        except Exception as e:
+            print(f"An error occurred: {str(e)}")
+
+    records = []
+    for file_path in window:
+        media_type = get_media_type(file_path)
+        if media_type == 'image':
+            gps, date, width, height = images[file_path]
+            source = 'exif'
+            if date is None:
+                date = image_dates.get(file_path)
+                source = 'metadata'
+        elif media_type == 'video':
+            header = video_headers[file_path]
+            gps, date = header['gps'], header['creation_time']
+            width, height = header['width'], header['height']
+            source = 'metadata'
+        else:
+            gps, date, width, height = None, None, None, None
+            source = None
+        records.append(_build_record(file_path, media_type, gps, date, source, width, height))
+    return records, unfinished
+
+def _build_record(file_path, media_type, gps, date, source, width, height):
+    try:
+        stat = os.stat(file_path)
+        size, mtime = stat.st_size, stat.st_mtime
+    except OSError as e:
+        print(f"Error reading file information: {e}")
+        size, mtime = None, None
+
+    if date is None and mtime is not None:
+        date = datetime.fromtimestamp(mtime)
+        source = 'mtime'
+    elif date is None:
+        source = None
+
+    return MediaRecord(file_path, media_type, gps, date, source, width, height, size, mtime)
+
+def _read_video_header(file_path):
+    empty = {'gps': None, 'creation_time': None, 'width': None, 'height': None, 'gps_atom': True}
+    if os.path.splitext(file_path)[1].lower() not in QUICKTIME_FORMATS:
+        return empty
+    try:
+        return read_quicktime_header(file_path) or empty
+    except IOError as e:
+        print(f"Error opening the video file: {e}")
+        return empty
+
+def _read_image(file_path):
+    """Return (gps, capture_time, width, height) for an image"""
+    try:
+        header = read_image_header(file_path)
+        if header is not None:
+            return header['gps'], header['datetime_original'], header['width'], header['height']
+    except IOError as e:
+        print(f"Error opening the image file: {e}")
+        return None, None, None, None
+
+    # Formats without a native reader go through Pillow, still in a single open
+    register_heif_opener_once()
+    try:
+        with Image.open(file_path) as img:
+            width, height = img.size
+            exif = img.getexif()
+            gps = _gps_from_pillow(exif.get_ifd(0x8825))
+            date = None
+            date_value = exif.get_ifd(0x8769).get(0x9003)
+            if date_value:
+                try:
+                    date = datetime.strptime(date_value, "%Y:%m:%d %H:%M:%S")
+                except ValueError:
+                    pass
+            return gps, date, width, height
+    except Exception as e:
+        print(f"Error processing the image EXIF data: {e}")
+        return None, None, None, None
+
+def _gps_from_pillow(gps_info):
+    lat = gps_info.get(2)
+    lat_ref = gps_info.get(1)
+    lon = gps_info.get(4)
+    lon_ref = gps_info.get(3)
+    if not (lat and lon and lat_ref and lon_ref):
+        return None
+
+    try:
+        lat = float(lat[0]) + float(lat[1]) / 60.0 + float(lat[2]) / 3600.0
+        lon = float(lon[0]) + float(lon[1]) / 60.0 + float(lon[2]) / 3600.0
+    except (TypeError, ValueError, ZeroDivisionError, IndexError):
+        return None
+    return (-lat if lat_ref == 'S' else lat, -lon if lon_ref == 'W' else lon)
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
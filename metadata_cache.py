@@ -0,0 +1,140 @@
+from constants import METADATA_CACHE_PATH, METADATA_CACHE_MAX_BYTES
+from media_record import MediaRecord
+from datetime import datetime
+import sqlite3
+import time
+import os
+
+class MetadataCache:
+    """SQLite cache of extracted metadata keyed by file identity rather than path.
+
+    The primary key is (device, inode, size, mtime_ns), so files moved within a
+    filesystem stay hits. Files copied across devices keep their size and mtime,
+    which is what the (name, size, mtime_ns) fallback key catches.
+    """
+
+    def __init__(self, db_path=METADATA_CACHE_PATH, max_bytes=METADATA_CACHE_MAX_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS media (
+                dev INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                media_type TEXT,
+                lat REAL,
+                lon REAL,
+                capture_time TEXT,
+                time_source TEXT,
+                width INTEGER,
+                height INTEGER,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (dev, ino, size, mtime_ns)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS media_moved ON media (name, size, mtime_ns)")
+        self.conn.commit()
+
+    def lookup_many(self, file_paths, stats=None):
+        """Return ({path: MediaRecord} for hits, {path: stat_result} for every path that exists)"""
+        stats = dict(stats or {})
+        hits = {}
+        used = []
+        for file_path in file_paths:
+            stat = stats.get(file_path)
+            if stat is None:
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                stats[file_path] = stat
+
+            row = self.conn.execute(
+                "SELECT rowid, * FROM media WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?",
+                (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)).fetchone()
+            if row is None:
+                row = self.conn.execute(
+                    "SELECT rowid, * FROM media WHERE name = ? AND size = ? AND mtime_ns = ?",
+                    (os.path.basename(file_path), stat.st_size, stat.st_mtime_ns)).fetchone()
+                if row is not None:
+                    # Re-key the moved file so the next lookup hits on identity
+                    self.conn.execute("UPDATE OR REPLACE media SET dev = ?, ino = ? WHERE rowid = ?",
+                                      (stat.st_dev, stat.st_ino, row[0]))
+            if row is not None:
+                hits[file_path] = self._to_record(file_path, row, stat)
+                used.append(row[0])
+
+        if used:
+            now = int(time.time())
+            self.conn.executemany("UPDATE media SET last_used = ? WHERE rowid = ?",
+                                  [(now, rowid) for rowid in used])
+            self.conn.commit()
+        return hits, stats
+
+    def store_many(self, records, stats):
+        """Store freshly extracted records, using the stat taken before extraction"""
+        now = int(time.time())
+        rows = []
+        for record in records:
+            stat = stats.get(record.path)
+            if stat is None or record.media_type == 'other':
+                continue
+            lat, lon = record.gps if record.gps else (None, None)
+            capture_time = record.capture_time.isoformat() if record.capture_time else None
+            rows.append((stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns,
+                         os.path.basename(record.path), record.media_type, lat, lon, capture_time,
+                         record.time_source, record.width, record.height, now))
+        if not rows:
+            return
+
+        self.conn.executemany("INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.conn.commit()
+        self.evict()
+
+    def evict(self):
+        """Drop the least recently used tenth of the entries while the database is over budget"""
+        while self._database_size() > self.max_bytes:
+            count = self.conn.execute("SELECT COUNT(*) FROM media").fetchone()[0]
+            if count == 0:
+                break
+            self.conn.execute(
+                "DELETE FROM media WHERE rowid IN (SELECT rowid FROM media ORDER BY last_used LIMIT ?)",
+                (max(1, count // 10),))
+            self.conn.commit()
+
+    def clear(self):
+        self.conn.execute("DELETE FROM media")
+        self.conn.commit()
+        self.conn.execute("VACUUM")
+
+    def close(self):
+        self.conn.close()
+
+    def _database_size(self):
+        # Free pages are reused by later inserts, so only live pages count against the budget
+        page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        return (page_count - freelist_count) * page_size
+
+    def _to_record(self, file_path, row, stat):
+        (_, _, _, _, _, _, media_type, lat, lon, capture_time,
+         time_source, width, height, _) = row
+        gps = (lat, lon) if lat is not None and lon is not None else None
+        capture_time = datetime.fromisoformat(capture_time) if capture_time else None
+        return MediaRecord(file_path, media_type, gps, capture_time, time_source,
+                           width, height, stat.st_size, stat.st_mtime)
+
+def open_metadata_cache():
+    """Open the shared cache, or return None so extraction simply runs uncached"""
+    try:
+        return MetadataCache()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error opening metadata cache: {e}")
+        return None
@@ -0,0 +1,247 @@
+from constants import JOURNAL_DIR, JOURNAL_SYNC_EVERY, JOURNAL_KEEP
+from move_plan import PlannedMove
+from typing import List, NamedTuple, Optional, Set
+from datetime import datetime
+import json
+import os
+
+JOURNAL_VERSION = 1
+OPERATION_LABELS = {
+    'location_sort': "Location sort",
+    'time_sort': "Time sort",
+    'flatten': "Folder flattening",
+    'duplicates': "Duplicate moving",
+    'undo': "Undo",
+}
+
+class JournalState(NamedTuple):
+    """What a journal file says about its operation"""
+    path: str
+    operation: str
+    folder: str
+    created: str
+    moves: List[PlannedMove]
+    done: Set[int]
+    created_folders: List[str]
+    removed_folders: List[str]
+    finished: bool
+    abandoned: bool
+    undone: bool
+    undoes: Optional[str]  # For an undo, the journal of the operation it reverses
+
+    @property
+    def label(self):
+        return OPERATION_LABELS.get(self.operation, self.operation)
+
+    def remaining(self):
+        """(index, move) for every move not recorded as done"""
+        return [(index, move) for index, move in enumerate(self.moves) if index not in self.done]
+
+    def done_moves(self):
+        """The moves that happened, in the order they ran"""
+        return [move for index, move in enumerate(self.moves) if index in self.done]
+
+class MoveJournal:
+    """Append-only log of one operation's planned moves and of which ones have happened.
+
+    A plan is synced to disk before its first move, and finished moves are
+    synced every JOURNAL_SYNC_EVERY moves. After a crash the journal has no
+    finished line, so the operation can be resumed. Moves made after the last
+    sync show up as a missing source with its target in place.
+    """
+
+    def __init__(self, path, sync_every=JOURNAL_SYNC_EVERY):
+        self.path = path
+        self.sync_every = sync_every
+        self.count = len(load_journal(path).moves) if os.path.exists(path) else 0
+        self.unsynced = []
+        self.file = open(path, 'a', encoding='utf-8')
+
+    @classmethod
+    def create(cls, operation, folder, undoes=None, journal_dir=JOURNAL_DIR):
+        os.makedirs(journal_dir, exist_ok=True)
+        prune_journals(journal_dir, keep_path=undoes)
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{operation}.jsonl"
+        journal = cls(os.path.join(journal_dir, name))
+        journal._write({'type': 'operation', 'version': JOURNAL_VERSION, 'operation': operation,
+                        'folder': folder, 'created': datetime.now().isoformat(timespec='seconds'),
+                        'undoes': undoes})
+        return journal
+
+    def record_plan(self, moves):
+        """Log moves about to run and return the journal index of the first"""
+        base_index = self.count
+        self._write({'type': 'plan', 'moves': [list(move) for move in moves]})
+        self.count += len(moves)
+        self.sync()
+        return base_index
+
+    def record_folders(self, created=(), removed=()):
+        self._write({'type': 'folders', 'created': list(created), 'removed': list(removed)})
+
+    def mark_done(self, index):
+        self.unsynced.append(index)
+        if len(self.unsynced) >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        if self.unsynced:
+            self._write({'type': 'done', 'indexes': self.unsynced})
+            self.unsynced = []
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def finish(self):
+        """Mark the operation complete; call it only once the operation has succeeded"""
+        if self.count:
+            self._write({'type': 'finished'})
+        self.close()
+
+    def abandon(self):
+        """Stop offering to resume the operation"""
+        self._write({'type': 'abandoned'})
+        self.close()
+
+    def mark_undone(self):
+        self._write({'type': 'undone'})
+        self.close()
+
+    def close(self):
+        """Close without finishing, so an operation stopped by an error is offered for resuming.
+
+        A journal that planned no moves has nothing to resume or undo and is removed.
+        """
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+            if self.count == 0:
+                os.remove(self.path)
+
+    def _write(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+def load_journal(path):
+    """Read a journal; a line cut short by a crash is ignored"""
+    header = {}
+    moves = []
+    done = set()
+    created_folders = []
+    removed_folders = []
+    finished = abandoned = undone = False
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            kind = entry.get('type')
+            if kind == 'operation':
+                header = entry
+            elif kind == 'plan':
+                moves.extend(PlannedMove(*move) for move in entry['moves'])
+            elif kind == 'done':
+                done.update(entry['indexes'])
+            elif kind == 'folders':
+                created_folders.extend(entry.get('created', []))
+                removed_folders.extend(entry.get('removed', []))
+            elif kind == 'finished':
+                finished = True
+            elif kind == 'abandoned':
+                abandoned = True
+            elif kind == 'undone':
+                undone = True
+    return JournalState(path, header.get('operation'), header.get('folder'), header.get('created'),
+                        moves, done, created_folders, removed_folders, finished, abandoned, undone,
+                        header.get('undoes'))
+
+def list_journals(journal_dir=JOURNAL_DIR):
+    """Every readable journal, newest first"""
+    try:
+        names = sorted((name for name in os.listdir(journal_dir) if name.endswith('.jsonl')), reverse=True)
+    except OSError:
+        return []
+    journals = []
+    for name in names:
+        try:
+            journals.append(load_journal(os.path.join(journal_dir, name)))
+        except OSError as e:
+            print(f"Error reading journal {name}: {e}")
+    return journals
+
+def latest_unfinished_journal(journal_dir=JOURNAL_DIR) -> Optional[JournalState]:
+    """The newest operation that stopped partway and was neither resumed nor abandoned"""
+    for journal in list_journals(journal_dir):
+        if not journal.finished and not journal.abandoned and journal.remaining():
+            return journal
+    return None
+
+def latest_undoable_journal(journal_dir=JOURNAL_DIR) -> Optional[JournalState]:
+    """The newest operation not yet undone, or None while one is still waiting to be resumed"""
+    for journal in list_journals(journal_dir):
+        if journal.operation == 'undo' or journal.undone:
+            continue
+        if not journal.finished and not journal.abandoned:
+            return None
+        if journal.done:
+            return journal
+    return None
+
+def remove_created_folders(journal_state):
+    """Remove the folders an operation created that are empty again, deepest first"""
+    for folder in sorted(set(journal_state.created_folders), key=lambda path: path.count(os.sep), reverse=True):
+        try:
+            os.rmdir(folder)
+        except OSError:
+            pass  # Gone already, or holding files put there since
+
+def complete_undo(journal_state):
+    """Tidy up after the moves of an undo have run: created folders go, removed ones come back"""
+    remove_created_folders(journal_state)
+    for folder in journal_state.removed_folders:
+        try:
+            os.makedirs(folder, exist_ok=True)
+        except OSError as e:
+            print(f"Error restoring folder {folder}: {e}")
+    if os.path.exists(journal_state.path):
+        MoveJournal(journal_state.path).mark_undone()
+
+def prune_journals(journal_dir=JOURNAL_DIR, keep=JOURNAL_KEEP, keep_path=None):
+    """Delete the oldest operations beyond keep.
+
+    Undo journals do not count towards keep and go with the operation they
+    reverse, so stepping back through history never prunes what it is about
+    to undo. keep_path is kept whatever its age.
+    """
+    try:
+        names = sorted((name for name in os.listdir(journal_dir) if name.endswith('.jsonl')), reverse=True)
+    except OSError:
+        return
+    undo_names = [name for name in names if name.endswith('-undo.jsonl')]
+    kept = set([name for name in names if name not in undo_names][:keep])
+    if keep_path:
+        kept.add(os.path.basename(keep_path))
+    for name in undo_names:
+        undoes = _read_header(os.path.join(journal_dir, name)).get('undoes')
+        if undoes and os.path.basename(undoes) in kept:
+            kept.add(name)
+    for name in names:
+        if name not in kept:
+            try:
+                os.remove(os.path.join(journal_dir, name))
+            except OSError:
+                pass
+
+def _read_header(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.loads(f.readline())
+    except (OSError, ValueError):
+        return {}
+
+def open_journal(operation, folder, undoes=None):
+    """Start a journal for an operation, or return None so it simply runs unjournaled"""
+    try:
+        return MoveJournal.create(operation, folder, undoes)
+    except OSError as e:
+        print(f"Error opening move journal: {e}")
+        return None
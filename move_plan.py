@@ -0,0 +1,175 @@
+from collections import Counter
+from typing import NamedTuple
+import shutil
+import errno
+import os
+
+class PlannedMove(NamedTuple):
+    source: str
+    folder: str
+    name: str
+
+    @property
+    def target(self):
+        return os.path.join(self.folder, self.name)
+
+class NameIndex:
+    """The names taken in one folder, handing out free ones in constant time.
+
+    The folder is listed with one os.scandir the first time a free name is
+    needed. A counter per name remembers the last suffix handed out, so
+    thousands of files called IMG_0001.JPG cost one lookup each instead of
+    probing every suffix before theirs. Names compare as the filesystem
+    does, ignoring case on Windows.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.taken = set()
+        self.counters = {}
+        self.listed = False
+
+    def claim(self, name):
+        self.taken.add(os.path.normcase(name))
+
+    def free_name(self, name):
+        """Claim name, or 'name (n)' with the lowest n not yet taken or handed out"""
+        if not self.listed:
+            self._list()
+        key = os.path.normcase(name)
+        if key not in self.taken:
+            self.taken.add(key)
+            return name
+        base_name, ext = os.path.splitext(name)
+        counter = self.counters.get(key, 0)
+        while True:
+            counter += 1
+            candidate = f"{base_name} ({counter}){ext}"
+            if os.path.normcase(candidate) not in self.taken:
+                break
+        self.counters[key] = counter
+        self.taken.add(os.path.normcase(candidate))
+        return candidate
+
+    def _list(self):
+        self.listed = True
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    self.claim(entry.name)
+        except OSError:
+            pass  # A folder the plan has yet to create
+
+class MovePlan:
+    """Every move of an operation, worked out before any file is touched.
+
+    Iterate the plan or call folder_counts() to see what will happen. execute()
+    creates each target folder once instead of checking it per file, then
+    renames the files, copying only when a target is on another device.
+    """
+
+    def __init__(self):
+        self.moves = []
+        self.names = {}
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __iter__(self):
+        return iter(self.moves)
+
+    def add(self, source, folder, name=None, keep_both=False):
+        """Plan moving source into folder, under its own name unless one is given.
+
+        With keep_both a name already there gets a ' (n)' suffix.
+        """
+        name = name or os.path.basename(source)
+        names = self.names.get(folder)
+        if names is None:
+            names = self.names[folder] = NameIndex(folder)
+        if keep_both:
+            name = names.free_name(name)
+        else:
+            names.claim(name)
+        move = PlannedMove(source, folder, name)
+        self.moves.append(move)
+        return move
+
+    def folders(self):
+        """Target folders in the order they are first used"""
+        return list(dict.fromkeys(move.folder for move in self.moves))
+
+    def folder_counts(self):
+        return Counter(move.folder for move in self.moves)
+
+    def execute(self, journal=None):
+        """Create the target folders, then move the files; yield (move, error or None) for each.
+
+        With a MoveJournal the plan is logged before anything moves and each
+        finished move is recorded, so a crash partway can be resumed.
+        """
+        base_index = journal.record_plan(self.moves) if journal is not None else 0
+        return run_moves(list(enumerate(self.moves, base_index)), journal)
+
+def run_moves(indexed_moves, journal=None):
+    """Run [(journal index, PlannedMove), ...], creating each target folder once"""
+    folder_errors = {}
+    for folder in dict.fromkeys(move.folder for _, move in indexed_moves):
+        # Folders made here are logged so an undo can take them away again
+        created = _missing_folders(folder) if journal is not None else []
+        try:
+            os.makedirs(folder, exist_ok=True)
+        except OSError as e:
+            folder_errors[folder] = e
+        else:
+            if created:
+                journal.record_folders(created)
+
+    for index, move in indexed_moves:
+        error = folder_errors.get(move.folder)
+        if error is None:
+            try:
+                move_file(move.source, move.target)
+            except OSError as e:
+                error = e
+            else:
+                if journal is not None:
+                    journal.mark_done(index)
+        yield move, error
+
+def _missing_folders(folder):
+    """folder and those of its parents that do not exist yet, deepest first"""
+    missing = []
+    while not os.path.isdir(folder):
+        missing.append(folder)
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            break
+        folder = parent
+    return missing
+
+def move_file(source, target):
+    """Rename within a filesystem; copy and delete only across devices. A file at target is never replaced"""
+    # Plans avoid taken names, but a file can appear there after planning, or before a resumed move
+    if os.path.lexists(target):
+        raise FileExistsError(errno.EEXIST, "A file with this name is already there", target)
+    try:
+        os.replace(source, target)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(source, target)
+
+def remove_empty_folders(root):
+    """Remove empty folders below root, deepest first; yield (folder, error or None) for each one tried"""
+    for folder, dirs, _ in os.walk(root, topdown=False):
+        for dir_name in dirs:
+            dir_path = os.path.join(folder, dir_name)
+            try:
+                if os.listdir(dir_path):
+                    continue
+                os.rmdir(dir_path)
+            except OSError as e:
+                yield dir_path, e
+            else:
+                yield dir_path, None
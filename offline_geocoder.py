@@ -0,0 +1,251 @@
+from constants import GAZETTEER_PATH, GEOCODER_MAX_DISTANCE_KM
+from typing import NamedTuple, Optional
+from bisect import bisect_left, bisect_right
+from array import array
+import threading
+import struct
+import math
+import zlib
+import sys
+
+GAZETTEER_MAGIC = b'PPGZ'
+GAZETTEER_VERSION = 1
+# Coordinates are stored as integer 1e-5 degrees (about a metre)
+COORDINATE_SCALE = 100000
+# Grid cells are half a degree square; records are stored sorted by cell
+CELL_DEGREES = 0.5
+GRID_ROWS = int(180 / CELL_DEGREES)
+GRID_COLS = int(360 / CELL_DEGREES)
+KM_PER_DEGREE = 111.195
+SEED_RECORDS = 8
+
+_HEADER = struct.Struct('<4sHIHI')
+
+_gazetteer = None
+_gazetteer_loaded = False
+_gazetteer_lock = threading.Lock()
+
+class Place(NamedTuple):
+    """A reverse geocoding answer, from the widest area to the narrowest"""
+    country: Optional[str]
+    country_code: Optional[str]  # ISO 3166-1 alpha-2, as used for the world map's path ids
+    state: Optional[str]
+    county: Optional[str]
+    city: Optional[str]
+    suburb: Optional[str]
+
+class Gazetteer:
+    """Populated places held in flat arrays and looked up through a fixed lat/lon grid"""
+
+    def __init__(self, lats, lons, admins, countries, name_offsets, names, admin_names, country_table):
+        self.lats = lats
+        self.lons = lons
+        self.admins = admins
+        self.countries = countries
+        self.name_offsets = name_offsets
+        self.names = names
+        self.admin_names = admin_names
+        self.country_table = country_table
+        self.country_names = dict(country_table)
+        self.cell_offsets = self._build_cell_offsets()
+
+    def __len__(self):
+        return len(self.lats)
+
+    def nearest(self, lat, lon, max_km=GEOCODER_MAX_DISTANCE_KM):
+        """Return the Place of the closest town within max_km, or None"""
+        index = self.nearest_index(lat, lon, max_km)
+        if index is None:
+            return None
+        code, country = self.country_table[self.countries[index]]
+        state = self.admin_names[self.admins[index]] or None
+        return Place(country, code, state, None, self.place_name(index), None)
+
+    def nearest_index(self, lat, lon, max_km=GEOCODER_MAX_DISTANCE_KM):
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return None
+        row, col = _cell(lat, lon)
+        qlat, qlon = lat * COORDINATE_SCALE, lon * COORDINATE_SCALE
+        # Equirectangular distance scaled at the query latitude; plenty for picking a town
+        scale = max(math.cos(math.radians(lat)), 0.01)
+        max_rings = min(int(max_km / KM_PER_DEGREE / CELL_DEGREES / scale) + 1, GRID_COLS // 2)
+        # How far the query sits from the edges of its own cell, in scaled degrees
+        lat_margin = min(lat + 90 - row * CELL_DEGREES, (row + 1) * CELL_DEGREES - lat - 90)
+        lon_margin = min(lon + 180 - col * CELL_DEGREES, (col + 1) * CELL_DEGREES - lon - 180)
+
+        lats, lons, offsets = self.lats, self.lons, self.cell_offsets
+        full_turn = 360 * COORDINATE_SCALE
+        best_index = None
+        best_radius = max_km / KM_PER_DEGREE * COORDINATE_SCALE
+
+        # Seed the radius from the records next to the query's latitude in its own cell,
+        # so dense cells are narrowed to a thin band straight away
+        home = row * GRID_COLS + col
+        position = bisect_left(lats, qlat, offsets[home], offsets[home + 1])
+        for i in range(max(position - SEED_RECORDS, offsets[home]), min(position + SEED_RECORDS, offsets[home + 1])):
+            dlon = abs(lons[i] - qlon)
+            distance = math.sqrt((lats[i] - qlat) ** 2 + (min(dlon, full_turn - dlon) * scale) ** 2)
+            if distance < best_radius:
+                best_index, best_radius = i, distance
+
+        for ring in range(max_rings + 1):
+            if ring:
+                # Nothing in this ring or beyond can be closer than its inner edge
+                reach = min(lat_margin + (ring - 1) * CELL_DEGREES,
+                            (lon_margin + (ring - 1) * CELL_DEGREES) * scale)
+                if reach * COORDINATE_SCALE >= best_radius:
+                    break
+            for cell_row, cell_col in _ring_cells(row, col, ring):
+                cell = cell_row * GRID_COLS + cell_col
+                # Records within a cell are sorted by latitude, so only a band needs scanning
+                start = bisect_left(lats, qlat - best_radius, offsets[cell], offsets[cell + 1])
+                end = bisect_right(lats, qlat + best_radius, start, offsets[cell + 1])
+                best_distance = best_radius * best_radius
+                for i in range(start, end):
+                    dlon = abs(lons[i] - qlon)
+                    if dlon > full_turn / 2:
+                        dlon = full_turn - dlon
+                    dlat = lats[i] - qlat
+                    distance = dlat * dlat + (dlon * scale) ** 2
+                    if distance < best_distance:
+                        best_index, best_distance = i, distance
+                best_radius = math.sqrt(best_distance)
+        return best_index
+
+    def place_name(self, index):
+        return self.names[self.name_offsets[index]:self.name_offsets[index + 1]].decode('utf-8')
+
+    def _build_cell_offsets(self):
+        counts = array('I', bytes(4 * (GRID_ROWS * GRID_COLS + 1)))
+        for lat, lon in zip(self.lats, self.lons):
+            row, col = _cell(lat / COORDINATE_SCALE, lon / COORDINATE_SCALE)
+            counts[row * GRID_COLS + col + 1] += 1
+        for cell in range(1, len(counts)):
+            counts[cell] += counts[cell - 1]
+        return counts
+
+def _cell(lat, lon):
+    row = min(int((lat + 90) / CELL_DEGREES), GRID_ROWS - 1)
+    col = int((lon + 180) / CELL_DEGREES) % GRID_COLS
+    return row, col
+
+def _ring_cells(row, col, ring):
+    """Cells on the square ring `ring` cells away, wrapping in longitude and clipped at the poles"""
+    if ring == 0:
+        yield row, col
+        return
+    cols = sorted({(col + offset) % GRID_COLS for offset in range(-ring, ring + 1)})
+    for cell_row in (row - ring, row + ring):
+        if 0 <= cell_row < GRID_ROWS:
+            for cell_col in cols:
+                yield cell_row, cell_col
+    side_cols = {(col - ring) % GRID_COLS, (col + ring) % GRID_COLS}
+    for cell_row in range(max(row - ring + 1, 0), min(row + ring, GRID_ROWS)):
+        for cell_col in side_cols:
+            yield cell_row, cell_col
+
+def load_gazetteer(path=GAZETTEER_PATH):
+    """Read a gazetteer file written by write_gazetteer"""
+    with open(path, 'rb') as f:
+        magic, version, count, country_count, admin_count = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != GAZETTEER_MAGIC or version != GAZETTEER_VERSION:
+            raise ValueError(f"Not a version {GAZETTEER_VERSION} gazetteer file: {path}")
+        payload = zlib.decompress(f.read())
+
+    pos = 0
+    def take(size):
+        nonlocal pos
+        chunk = payload[pos:pos + size]
+        pos += size
+        return chunk
+
+    def take_array(typecode, length):
+        values = array(typecode)
+        values.frombytes(take(values.itemsize * length))
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values
+
+    country_table = [tuple(line.split('\t', 1)) for line in
+                     take(struct.unpack('<I', take(4))[0]).decode('utf-8').split('\n')]
+    admin_names = take(struct.unpack('<I', take(4))[0]).decode('utf-8').split('\n')
+    if len(country_table) != country_count or len(admin_names) != admin_count:
+        raise ValueError(f"Corrupt gazetteer file: {path}")
+
+    lats = take_array('i', count)
+    lons = take_array('i', count)
+    admins = take_array('H', count)
+    countries = take_array('H', count)
+    name_offsets = take_array('I', count + 1)
+    names = take(name_offsets[-1])
+    return Gazetteer(lats, lons, admins, countries, name_offsets, names, admin_names, country_table)
+
+def write_gazetteer(path, places, country_names):
+    """Write places [(lat, lon, name, state, country_code)] and {country_code: name} to path"""
+    country_codes = sorted(country_names)
+    country_index = {code: index for index, code in enumerate(country_codes)}
+    admin_names = ['']
+    admin_index = {'': 0}
+
+    records = []
+    for lat, lon, name, state, country_code in places:
+        if country_code not in country_index:
+            continue
+        state = state or ''
+        if state not in admin_index:
+            admin_index[state] = len(admin_names)
+            admin_names.append(state)
+        records.append((_cell(lat, lon), round(lat * COORDINATE_SCALE), round(lon * COORDINATE_SCALE),
+                        name, admin_index[state], country_index[country_code]))
+    records.sort(key=lambda record: (record[0], record[1], record[2]))
+
+    lats, lons = array('i'), array('i')
+    admins, countries = array('H'), array('H')
+    name_offsets = array('I', [0])
+    names = bytearray()
+    for _, lat, lon, name, admin, country in records:
+        lats.append(lat)
+        lons.append(lon)
+        admins.append(admin)
+        countries.append(country)
+        names += name.encode('utf-8')
+        name_offsets.append(len(names))
+
+    country_blob = '\n'.join(f"{code}\t{country_names[code]}" for code in country_codes).encode('utf-8')
+    admin_blob = '\n'.join(admin_names).encode('utf-8')
+    payload = bytearray()
+    for blob in (country_blob, admin_blob):
+        payload += struct.pack('<I', len(blob)) + blob
+    for values in (lats, lons, admins, countries, name_offsets):
+        if sys.byteorder != 'little':
+            values.byteswap()
+        payload += values.tobytes()
+    payload += names
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(GAZETTEER_MAGIC, GAZETTEER_VERSION, len(records),
+                             len(country_codes), len(admin_names)))
+        f.write(zlib.compress(bytes(payload), 9))
+    return len(records)
+
+def get_gazetteer():
+    """Load the bundled gazetteer once per process; None if it is missing or unreadable"""
+    global _gazetteer, _gazetteer_loaded
+    if _gazetteer_loaded:
+        return _gazetteer
+    with _gazetteer_lock:
+        if not _gazetteer_loaded:
+            try:
+                _gazetteer = load_gazetteer()
+            except (OSError, ValueError, zlib.error, struct.error) as e:
+                print(f"Error loading offline gazetteer: {e}")
+                _gazetteer = None
+            _gazetteer_loaded = True
+    return _gazetteer
+
+def reverse_geocode(lat, lon):
+    """Offline reverse geocoding; None when there is no gazetteer or no place nearby"""
+    gazetteer = get_gazetteer()
+    if gazetteer is None:
+        return None
+    return gazetteer.nearest(lat, lon)
@@ -0,0 +1,137 @@
+from media_io import open_window, BytesWindow, iter_boxes
+from datetime import datetime, timedelta
+import struct
+import re
+
+# Boxes that are read into memory whole; anything bigger is not metadata
+MAX_BOX_BYTES = 1024 * 1024
+
+QUICKTIME_EPOCH = datetime(1904, 1, 1)
+TOP_LEVEL_BOXES = (b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot', b'uuid')
+LOCATION_KEY = b'com.apple.quicktime.location.ISO6709'
+ISO6709_PATTERN = re.compile(r'([+-]\d+(?:\.\d+)?)([+-]\d+(?:\.\d+)?)')
+
+def read_quicktime_header(file_path):
+    """Read GPS, capture time and size from the moov box of a MP4/MOV file without touching mdat.
+
+    Returns None when the file is not a QuickTime/ISO media file or has no readable moov box.
+    Otherwise returns a dict with 'gps', 'creation_time', 'width' and 'height' keys, any of
+    which may be None. 'creation_time' is the mvhd CreateDate (UTC), like ExifTool reports it.
+    'gps_atom' is False when moov was searched whole and holds no location atom, so a missing
+    'gps' is final.
+    """
+    with open_window(file_path) as window:
+        try:
+            head = window.read_at(0, 8)
+            if len(head) < 8 or head[4:8] not in TOP_LEVEL_BOXES:
+                return None
+
+            # moov may sit before or after mdat; mdat itself is only ever skipped over
+            for box_type, start, end in iter_boxes(window, 0, None):
+                if box_type == b'moov':
+                    result = {'gps': None, 'creation_time': None, 'width': None, 'height': None,
+                              'gps_atom': False}
+                    _parse_moov(window, start, end, result)
+                    return result
+            return None
+        except (struct.error, IndexError, ValueError):
+            return None
+
+def _parse_moov(window, start, end, result):
+    for box_type, child_start, child_end in iter_boxes(window, start, end):
+        if box_type == b'mvhd':
+            result['creation_time'] = _read_mvhd_time(window.read_at(child_start, 12))
+        elif box_type == b'trak' and result['width'] is None:
+            _parse_trak(window, child_start, child_end, result)
+        elif box_type in (b'udta', b'meta'):
+            if child_end - child_start > MAX_BOX_BYTES:
+                result['gps_atom'] = True  # Too big to search, so it may hold one
+                continue
+            data = window.read_at(child_start, child_end - child_start)
+            if box_type == b'udta':
+                _parse_udta(data, result)
+            else:
+                _parse_mdta_meta(data, result)
+
+def _read_mvhd_time(data):
+    version = data[0]
+    if version == 1:
+        seconds = struct.unpack('>Q', data[4:12])[0]
+    else:
+        seconds = struct.unpack('>I', data[4:8])[0]
+    if seconds == 0:
+        return None
+    return QUICKTIME_EPOCH + timedelta(seconds=seconds)
+
+def _parse_trak(window, start, end, result):
+    for box_type, child_start, child_end in iter_boxes(window, start, end):
+        if box_type != b'tkhd':
+            continue
+        data = window.read_at(child_start, min(child_end - child_start, 96))
+        width_offset = 88 if data[0] == 1 else 76
+        if len(data) >= width_offset + 8:
+            width, height = struct.unpack('>II', data[width_offset:width_offset + 8])
+            # Audio tracks have a zero size
+            if width and height:
+                result['width'], result['height'] = width >> 16, height >> 16
+        return
+
+def _parse_udta(data, result):
+    window = BytesWindow(data)
+    for box_type, start, end in iter_boxes(window, 0, len(data)):
+        if box_type == b'\xa9xyz' and result['gps'] is None:
+            result['gps_atom'] = True
+            # Counted string: 16-bit length, 16-bit language code, then the text
+            length = struct.unpack('>H', data[start:start + 2])[0]
+            result['gps'] = _parse_iso6709(data[start + 4:start + 4 + length])
+        elif box_type == b'meta':
+            # udta/meta is a full box holding an iTunes-style ilst
+            for child_type, child_start, child_end in iter_boxes(window, start + 4, end):
+                if child_type == b'ilst':
+                    for item_type, item_start, item_end in iter_boxes(window, child_start, child_end):
+                        if item_type == b'\xa9xyz' and result['gps'] is None:
+                            result['gps_atom'] = True
+                            result['gps'] = _parse_iso6709(_read_data_box(data, item_start, item_end))
+
+def _parse_mdta_meta(data, result):
+    """Read the Apple keys/ilst pair that holds com.apple.quicktime.location.ISO6709"""
+    window = BytesWindow(data)
+    boxes = {box_type: (start, end) for box_type, start, end in iter_boxes(window, 0, len(data))}
+    if b'keys' not in boxes or b'ilst' not in boxes:
+        return
+
+    keys_start, keys_end = boxes[b'keys']
+    entry_count = struct.unpack('>I', data[keys_start + 4:keys_start + 8])[0]
+    keys = {}
+    pos = keys_start + 8
+    for index in range(1, entry_count + 1):
+        if pos + 8 > keys_end:
+            break
+        key_size = struct.unpack('>I', data[pos:pos + 4])[0]
+        if key_size < 8:
+            break
+        keys[index] = data[pos + 8:pos + key_size]
+        pos += key_size
+
+    ilst_start, ilst_end = boxes[b'ilst']
+    for item_type, item_start, item_end in iter_boxes(window, ilst_start, ilst_end):
+        key_index = struct.unpack('>I', item_type)[0]
+        if keys.get(key_index) == LOCATION_KEY and result['gps'] is None:
+            result['gps_atom'] = True
+            result['gps'] = _parse_iso6709(_read_data_box(data, item_start, item_end))
+
+def _read_data_box(data, start, end):
+    for box_type, data_start, data_end in iter_boxes(BytesWindow(data), start, end):
+        if box_type == b'data':
+            # Skip the type indicator and locale
+            return data[data_start + 8:data_end]
+    return b""
+
+def _parse_iso6709(value):
+    match = ISO6709_PATTERN.match(bytes(value).decode('ascii', 'replace').strip())
+    if not match:
+        return None
+    lat, lon = float(match.group(1)), float(match.group(2))
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
@@ -0,0 +1,76 @@
+"""Build assets/boundaries.bin from Natural Earth GeoJSON.
+
+Download the admin 0 (countries) and admin 1 (states and provinces) layers from
+https://www.naturalearthdata.com/ as GeoJSON, for example
+ne_110m_admin_0_countries.geojson and ne_110m_admin_1_states_provinces.geojson,
+and run from the repository root:
+
+    python -m tools.build_boundaries ne_110m_admin_0_countries.geojson ne_110m_admin_1_states_provinces.geojson
+
+Countries are keyed by ISO_A2_EH (falling back to ISO_A2) and US states by their
+postal code, which are the path ids of assets/world_map.svg and assets/us_map.svg.
+"""
+from boundary_resolver import write_boundaries, COUNTRY, STATE
+from constants import BOUNDARIES_PATH
+import argparse
+import json
+import os
+
+def iter_polygon_rings(geometry):
+    if geometry is None:
+        return
+    if geometry['type'] == 'Polygon':
+        yield from geometry['coordinates']
+    elif geometry['type'] == 'MultiPolygon':
+        for polygon in geometry['coordinates']:
+            yield from polygon
+
+def _property(properties, *names):
+    for name in names:
+        value = properties.get(name)
+        if value and value != '-99':
+            return value
+    return None
+
+def read_countries(path):
+    with open(path, encoding='utf-8') as f:
+        features = json.load(f)['features']
+    regions = []
+    for feature in features:
+        properties = feature['properties']
+        code = _property(properties, 'ISO_A2_EH', 'ISO_A2', 'iso_a2')
+        name = _property(properties, 'NAME', 'ADMIN', 'name')
+        rings = list(iter_polygon_rings(feature['geometry']))
+        if code and name and rings:
+            regions.append((COUNTRY, code, name, rings))
+    return regions
+
+def read_us_states(path):
+    with open(path, encoding='utf-8') as f:
+        features = json.load(f)['features']
+    regions = []
+    for feature in features:
+        properties = feature['properties']
+        if _property(properties, 'iso_a2', 'ISO_A2') != 'US':
+            continue
+        code = _property(properties, 'postal', 'POSTAL')
+        name = _property(properties, 'name', 'NAME')
+        rings = list(iter_polygon_rings(feature['geometry']))
+        if code and name and rings:
+            regions.append((STATE, code, name, rings))
+    return regions
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the map boundaries file")
+    parser.add_argument('countries', help="Natural Earth admin 0 countries GeoJSON")
+    parser.add_argument('states', help="Natural Earth admin 1 states and provinces GeoJSON")
+    parser.add_argument('--output', default=BOUNDARIES_PATH)
+    args = parser.parse_args()
+
+    regions = read_countries(args.countries) + read_us_states(args.states)
+    count = write_boundaries(args.output, regions)
+    size = os.path.getsize(args.output)
+    print(f"Wrote {count} regions to {args.output} ({size / 1024:.0f} KB)")
+
+if __name__ == '__main__':
+    main()
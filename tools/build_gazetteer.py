@@ -0,0 +1,134 @@
+"""Build assets/gazetteer.bin from the GeoNames dumps.
+
+Download these files from https://download.geonames.org/export/dump/ and pass
+their paths (the cities file may be unzipped or left as the .zip):
+
+    cities1000.zip        populated places with 1000+ inhabitants
+    admin1CodesASCII.txt  state/province names
+    countryInfo.txt       country names
+
+Run from the repository root:
+
+    python -m tools.build_gazetteer cities1000.zip admin1CodesASCII.txt countryInfo.txt
+
+Places are filed under the town a photo was taken in, not its neighbourhood:
+sections of a city are left out, and smaller places close to a capital or
+administrative seat in the same state are folded into it.
+
+GeoNames data is licensed under CC BY 4.0.
+"""
+from offline_geocoder import write_gazetteer
+from constants import GAZETTEER_PATH
+from typing import NamedTuple
+import argparse
+import zipfile
+import math
+import io
+import os
+
+# Sections of a city, abandoned, historical and destroyed places, and religious sites:
+# a photo is filed under the city rather than its neighbourhood
+EXCLUDED_FEATURE_CODES = {'PPLX', 'PPLH', 'PPLQ', 'PPLW', 'PPLCH'}
+# GeoNames lists administrative seats whatever their size, often with no population
+SEAT_FEATURE_CODES = {'PPLC', 'PPLA', 'PPLA2', 'PPLA3', 'PPLA4', 'PPLA5', 'PPLG'}
+# Seats that take in the smaller places around them, out to a radius growing with population
+MAJOR_FEATURE_CODES = {'PPLC', 'PPLA', 'PPLA2'}
+MAJOR_MIN_POPULATION = 100000
+MAJOR_KM_PER_SQRT_POPULATION = 0.003
+DEFAULT_MIN_POPULATION = 1000
+KM_PER_DEGREE = 111.195
+
+class City(NamedTuple):
+    lat: float
+    lon: float
+    name: str
+    country_code: str
+    admin1_code: str
+    feature_code: str
+    population: int
+
+def read_countries(path):
+    countries = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            columns = line.rstrip('\n').split('\t')
+            countries[columns[0]] = columns[4]
+    return countries
+
+def read_admin1(path):
+    admin1 = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            columns = line.rstrip('\n').split('\t')
+            if len(columns) >= 2:
+                admin1[columns[0]] = columns[1]
+    return admin1
+
+def iter_cities(path, admin1, min_population):
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            name = next(n for n in archive.namelist() if n.endswith('.txt'))
+            with archive.open(name) as f:
+                cities = list(_parse_cities(io.TextIOWrapper(f, encoding='utf-8'), min_population))
+    else:
+        with open(path, encoding='utf-8') as f:
+            cities = list(_parse_cities(f, min_population))
+    for city in _drop_absorbed(cities):
+        yield city.lat, city.lon, city.name, admin1.get(f"{city.country_code}.{city.admin1_code}"), city.country_code
+
+def _parse_cities(lines, min_population):
+    for line in lines:
+        columns = line.rstrip('\n').split('\t')
+        if len(columns) < 15 or columns[7] in EXCLUDED_FEATURE_CODES:
+            continue
+        population = int(columns[14] or 0)
+        if population < min_population and columns[7] not in SEAT_FEATURE_CODES:
+            continue
+        yield City(float(columns[4]), float(columns[5]), columns[1], columns[8], columns[10],
+                   columns[7], population)
+
+def _absorb_km(city):
+    if city.feature_code not in MAJOR_FEATURE_CODES or city.population < MAJOR_MIN_POPULATION:
+        return 0
+    return MAJOR_KM_PER_SQRT_POPULATION * math.sqrt(city.population)
+
+def _drop_absorbed(cities):
+    """Leave out smaller places lying within reach of a capital or seat in the same state"""
+    majors = {}
+    for city in cities:
+        if _absorb_km(city):
+            majors.setdefault((city.country_code, city.admin1_code), []).append(city)
+    for city in cities:
+        if _absorb_km(city):
+            yield city
+            continue
+        scale = max(math.cos(math.radians(city.lat)), 0.01)
+        for major in majors.get((city.country_code, city.admin1_code), ()):
+            if major.population < city.population:
+                continue
+            distance = KM_PER_DEGREE * math.hypot(major.lat - city.lat, (major.lon - city.lon) * scale)
+            if distance < _absorb_km(major):
+                break
+        else:
+            yield city
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline reverse geocoding gazetteer")
+    parser.add_argument('cities', help="GeoNames citiesNNNN.zip or .txt")
+    parser.add_argument('admin1', help="GeoNames admin1CodesASCII.txt")
+    parser.add_argument('countries', help="GeoNames countryInfo.txt")
+    parser.add_argument('--output', default=GAZETTEER_PATH)
+    parser.add_argument('--min-population', type=int, default=DEFAULT_MIN_POPULATION,
+                        help="Leave out smaller places, other than administrative seats")
+    args = parser.parse_args()
+
+    countries = read_countries(args.countries)
+    admin1 = read_admin1(args.admin1)
+    count = write_gazetteer(args.output, iter_cities(args.cities, admin1, args.min_population), countries)
+    size = os.path.getsize(args.output)
+    print(f"Wrote {count} places to {args.output} ({size / 1024 / 1024:.1f} MB)")
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,38 @@
 from PIL import Image, ExifTags, UnidentifiedImageError
-from constants import IMAGE_FORMATS, VIDEO_FORMATS
+from constants import (IMAGE_FORMATS, VIDEO_FORMATS, QUICKTIME_FORMATS, HEIF_FORMATS, EXIFTOOL_BATCH_SIZE,
+                       GEOCODER_ONLINE_FALLBACK, GEOCODER_TOWN_TRUST_KM, PLACE_BATCH_SIZE,
+                       PLACE_FOLDER_LAYOUTS, LOCATION_FOLDER_DEPTH)
+from heif_reader import read_heif_header, register_heif_opener_once
+from quicktime_reader import read_quicktime_header
+from exiftool_pool import exiftool_session
+from exif_reader import read_exif_header
+from geocoder_backends import get_geocoder_backend, GeocodingError
+from offline_geocoder import Place, get_gazetteer, reverse_geocode
+from boundary_resolver import get_boundaries
 from datetime import datetime
-import pillow_heif
 import exiftool
-import requests
-import shutil
 import piexif
 import os
 
-def check_internet_connection():
-    try:
-        # Try to connect to OpenStreetMap's servers with a timeout of 3 seconds
-        requests.get("https://nominatim.openstreetmap.org", timeout=3)
-        return True
-    except Exception:
-        return False
+# Only the tags an operation needs are requested, and -fast2 stops ExifTool
+# at the metadata instead of scanning whole media files
+GPS_TAGS = ['Composite:GPSLatitude', 'Composite:GPSLongitude']
+DATE_TAGS = ['QuickTime:CreateDate', 'EXIF:DateTimeOriginal']
+FAST_PARAMS = ['-fast2']
 
 def extract_gps_info_image(file_path):
-    pillow_heif.register_heif_opener()
+    try:
+        # JPEG, TIFF and HEIC are read straight from their EXIF block
+        header = read_image_header(file_path)
+        if header is not None:
+            if header['gps'] is None:
+                print("No GPS data found in the EXIF information.")
+            return header['gps']
+    except IOError as e:
+        print(f"Error opening the image file: {e}")
+        return None
+
+    register_heif_opener_once()
     
     try:
         with Image.open(file_path) as img:
@@ -56,66 +71,275 @@ def extract_gps_info_image(file_path):
         print(f"Error processing the image EXIF data: {e}")
     return None
 
-def extract_gps_info_video(file_path):  
+def extract_gps_info_video(file_path, exiftool_pool=None):
+    header = _read_quicktime_header(file_path)
+    # Without a location atom in moov there is nothing for ExifTool to find either
+    if header is not None and (header['gps'] is not None or not header['gps_atom']):
+        return header['gps']
+
     try:
-        with exiftool.ExifToolHelper() as et:
-            metadata = et.get_metadata(file_path)[0]
+        with exiftool_session(exiftool_pool) as et:
+            metadata = et.get_tags(file_path, GPS_TAGS, params=FAST_PARAMS)[0]
+            coordinates = gps_from_metadata(metadata)
             
-            print(f"Format: {metadata.get('File:FileType', 'Unknown')}")
-            print(f"Size: ({metadata.get('File:ImageWidth', 'Unknown')}, {metadata.get('File:ImageHeight', 'Unknown')})")
-            
-            lat = metadata.get('Composite:GPSLatitude')
-            lon = metadata.get('Composite:GPSLongitude')
-            
-            if lat is not None and lon is not None:
-                return float(lat), float(lon)
-            else:
+            if coordinates is None:
                 print("No GPS data found in the video metadata.")
-                return None
+            return coordinates
     except Exception as e:
         print(f"An error occurred: {str(e)}")
         return None
+
+def gps_from_metadata(metadata):
+    """Get (lat, lon) from an ExifTool metadata dict"""
+    lat = metadata.get('Composite:GPSLatitude')
+    lon = metadata.get('Composite:GPSLongitude')
     
+    if lat is not None and lon is not None:
+        return float(lat), float(lon)
+    return None
+
+def date_from_metadata(metadata):
+    """Get the capture date from an ExifTool metadata dict"""
+    create_date = metadata.get('QuickTime:CreateDate') or metadata.get('EXIF:DateTimeOriginal')
+    if create_date:
+        try:
+            return datetime.strptime(str(create_date), "%Y:%m:%d %H:%M:%S")
+        except ValueError:
+            pass
+    return None
+
+def iter_exiftool_metadata(file_paths, tags, exiftool_pool=None, batch_size=EXIFTOOL_BATCH_SIZE):
+    """Yield (file_path, metadata) for each path, reading many files per ExifTool request"""
+    file_paths = list(file_paths)
+    if not file_paths:
+        return
+
+    with exiftool_session(exiftool_pool) as et:
+        for start in range(0, len(file_paths), batch_size):
+            batch = file_paths[start:start + batch_size]
+            try:
+                results = et.get_tags(batch, tags, params=FAST_PARAMS)
+            except exiftool.exceptions.ExifToolExecuteError:
+                # One unreadable file fails the whole request, so retry the batch file by file
+                results = None
+
+            if results is not None and len(results) == len(batch):
+                for file_path, metadata in zip(batch, results):
+                    yield file_path, metadata
+                continue
+
+            for file_path in batch:
+                try:
+                    yield file_path, et.get_tags(file_path, tags, params=FAST_PARAMS)[0]
+                except exiftool.exceptions.ExifToolExecuteError:
+                    yield file_path, {}
+
+def _extension(file_path):
+    return os.path.splitext(file_path)[1].lower()
+
+def read_image_header(file_path):
+    """Native header read for an image; None means Pillow has to open it"""
+    if _extension(file_path) in HEIF_FORMATS:
+        return read_heif_header(file_path)
+    return read_exif_header(file_path)
+
+def _read_quicktime_header(file_path):
+    """Native moov box read for MP4/MOV files; None means ExifTool has to be asked"""
+    if _extension(file_path) not in QUICKTIME_FORMATS:
+        return None
+    try:
+        return read_quicktime_header(file_path)
+    except IOError as e:
+        print(f"Error opening the video file: {e}")
+        return None
+
 def convert_to_degrees(value):
     d = float(value[0][0]) / float(value[0][1])
     m = float(value[1][0]) / float(value[1][1])
     s = float(value[2][0]) / float(value[2][1])
     return d + (m / 60.0) + (s / 3600.0)
 
-def get_location_from_coordinates(lat, lon):
-    base_url = "https://nominatim.openstreetmap.org/reverse"
-    params = {
-        "lat": lat,
-        "lon": lon,
-        "format": "json"
-    }
-    headers = {
-        "User-Agent": "Media GPS Extractor/1.0"
-    }
-    
-    response = requests.get(base_url, params=params, headers=headers)
-    
-    if response.status_code == 200:
-        data = response.json()
-        address = data.get('address', {})
-        city = address.get('city') or address.get('town') or address.get('village') or address.get('county') or 'Unknown'
-        return city
+def get_location_from_coordinates(lat, lon, geocode_cache=None):
+    place = resolve_place(lat, lon, geocode_cache)
+    if place is None:
+        return 'Unknown'
+    return place.city or 'Unknown'
+
+def resolve_place(lat, lon, geocode_cache=None, backend=None):
+    """Place for coordinates from offline data, then the geocode cache, then the online backend"""
+    found, place = _resolve_places_locally([(lat, lon)], geocode_cache)[0]
+    if found:
+        return place
+
+    try:
+        place = (backend or get_geocoder_backend()).reverse(lat, lon)
+    except GeocodingError as e:
+        print(f"Error: {e}")
+        return None
+    if geocode_cache is not None:
+        geocode_cache.put(lat, lon, place)
+    return place
+
+def _resolve_places_locally(points, geocode_cache):
+    """Return [(found, Place or None)] for [(lat, lon)] without touching the network.
+
+    Offline answers are not cached: they cost no more than a cache read, and a
+    rebuilt gazetteer would otherwise be hidden behind the old one's answers.
+    The cache holds what the online backend said where offline data had nothing.
+    """
+    results = []
+    for (lat, lon), place in zip(points, offline_places(points)):
+        if place is not None:
+            results.append((True, place))
+            continue
+        found, place = geocode_cache.get(lat, lon) if geocode_cache is not None else (False, None)
+        # Only a missing answer is left to the network, and only when that is allowed
+        results.append((found or not GEOCODER_ONLINE_FALLBACK, place))
+    return results
+
+def offline_place(lat, lon):
+    """Nearest town from the gazetteer; away from towns the map outlines settle the country and US state"""
+    return offline_places([(lat, lon)])[0]
+
+def offline_places(points):
+    """offline_place for [(lat, lon)], checking the points far from any town against the outlines in one batch"""
+    gazetteer = get_gazetteer()
+    places = [None] * len(points)
+    if gazetteer is not None:
+        # The simplified outlines put border cities such as Geneva in the wrong country
+        places = [gazetteer.nearest(lat, lon, GEOCODER_TOWN_TRUST_KM) for lat, lon in points]
+    remote = [index for index, place in enumerate(places) if place is None]
+    if not remote:
+        return places
+    boundaries = get_boundaries()
+    if boundaries is not None:
+        matches = boundaries.resolve_many([points[index] for index in remote])
     else:
-        print(f"Error: Unable to fetch location data. Status code: {response.status_code}")
+        matches = [None] * len(remote)
+    for index, match in zip(remote, matches):
+        places[index] = _outline_place(reverse_geocode(*points[index]), match, gazetteer)
+    return places
+
+def _outline_place(place, match, gazetteer):
+    """The nearest town's Place with the country and US state of the outline the point lies in"""
+    if match is None:
+        return place
+    country = gazetteer.country_names.get(match.country_code) if gazetteer is not None else None
+    if place is None:
+        return Place(country or match.country, match.country_code, match.state, None, None, None)
+    if place.country_code != match.country_code:
+        # Near a border the nearest town can be across it; the outline decides the country and state
+        return place._replace(country=country or match.country, country_code=match.country_code,
+                              state=match.state, county=None)
+    if match.state:
+        return place._replace(state=match.state)
+    return place
+
+class PlaceLookups:
+    """Lookups started while files are still being read and collected once they are all needed.
+
+    Offline and cached answers are worked out a batch at a time; the rest go to
+    the online backend, which may answer in background threads. The cache is only
+    touched from the thread that owns this object, as SQLite connections require.
+    """
+
+    def __init__(self, geocode_cache=None, backend=None):
+        self.geocode_cache = geocode_cache
+        self.backend = backend
+        self.places = {}
+        self.queued = []
+        self.pending = {}
+        self.failed = set()
+
+    def start(self, key, lat, lon):
+        self.queued.append((key, lat, lon))
+        if len(self.queued) >= PLACE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Answer the queued lookups locally in one batch and send the rest to the backend"""
+        queued, self.queued = self.queued, []
+        results = _resolve_places_locally([(lat, lon) for _, lat, lon in queued], self.geocode_cache)
+        for (key, lat, lon), (found, place) in zip(queued, results):
+            if found:
+                self.places[key] = place
+            else:
+                self.backend = self.backend or get_geocoder_backend()
+                self.pending[key] = (lat, lon, self.backend.submit(lat, lon))
+
+    def results(self):
+        """Wait for the background lookups and return {key: Place or None}; see also failed"""
+        self.flush()
+        for key, (lat, lon, future) in self.pending.items():
+            try:
+                place = future.result()
+            except GeocodingError as e:
+                print(f"Error: {e}")
+                self.places[key] = None
+                self.failed.add(key)
+                continue
+            if self.geocode_cache is not None:
+                self.geocode_cache.put(lat, lon, place)
+            self.places[key] = place
+        self.pending = {}
+        return self.places
+
+    def cancel(self):
+        """Drop lookups that have not started; ones already running finish unheard"""
+        self.queued = []
+        for _, _, future in self.pending.values():
+            future.cancel()
+        self.pending = {}
+
+def place_folder(place, depth=LOCATION_FOLDER_DEPTH):
+    """Relative folder such as 'France/Île-de-France/Paris' for a Place, 'Unknown' without one"""
+    if place is None:
         return 'Unknown'
+    levels = PLACE_FOLDER_LAYOUTS[min(max(depth, 1), max(PLACE_FOLDER_LAYOUTS))]
+    names = []
+    for level in levels:
+        name = getattr(place, level)
+        if level == 'city':
+            name = name or 'Unknown'
+        if name:
+            names.append(safe_folder_name(name))
+    return os.path.join(*names)
 
-def move_to_folder(file_path, folder_name):
-    base_dir = os.path.dirname(file_path)
-    target_folder = os.path.join(base_dir, folder_name)
-    
-    if not os.path.exists(target_folder):
-        os.makedirs(target_folder)
-    
-    new_file_path = os.path.join(target_folder, os.path.basename(file_path))
-    shutil.move(file_path, new_file_path)
-    print(f"Moved to: {folder_name}")
+def safe_folder_name(name):
+    """A place or geofence name made safe as a single folder name"""
+    # Separators inside a name would otherwise open an extra folder level
+    return name.replace('/', '-').replace('\\', '-')
+
+def get_creation_time(file_path, exiftool_pool=None):
+    date = _get_exif_creation_time(file_path)
+    if date:
+        return date
+
+    header = _read_quicktime_header(file_path)
+    if header is not None and header['creation_time'] is not None:
+        return header['creation_time']
+
+    try:
+        with exiftool_session(exiftool_pool) as et:
+            metadata = et.get_tags(file_path, DATE_TAGS, params=FAST_PARAMS)[0]
+            date = date_from_metadata(metadata)
+            if date:
+                return date
+    except Exception:
+        pass
+
+    return datetime.fromtimestamp(os.path.getmtime(file_path))
+
+def _get_exif_creation_time(file_path):
+    if _extension(file_path) not in IMAGE_FORMATS:
+        return None
+    try:
+        header = read_image_header(file_path)
+        if header is not None:
+            return header['datetime_original']
+    except IOError:
+        return None
 
-def get_creation_time(file_path):
     try:
         with Image.open(file_path) as img:
             exif_data = img._getexif()
@@ -126,14 +350,4 @@ def get_creation_time(file_path):
                         return datetime.strptime(value, "%Y:%m:%d %H:%M:%S")
     except (AttributeError, KeyError, IndexError, TypeError, ValueError, IOError):
         pass
-
-    try:
-        with exiftool.ExifToolHelper() as et:
-            metadata = et.get_metadata(file_path)[0]
-            create_date = metadata.get('QuickTime:CreateDate') or metadata.get('EXIF:DateTimeOriginal')
-            if create_date:
-                return datetime.strptime(create_date, "%Y:%m:%d %H:%M:%S")
-    except Exception:
-        pass
-
-    return datetime.fromtimestamp(os.path.getmtime(file_path))
\ No newline at end of file
+    return None
\ No newline at end of file
@@ -1,12 +1,19 @@
-from constants import (IMAGE_FORMATS, VIDEO_FORMATS, SUPPORTED_MEDIA_FORMATS, STATE_MAPPING, 
-                       COUNTRY_MAPPING, COUNTRY_CODES)
-from utils import (extract_gps_info_image, extract_gps_info_video, 
-                   get_location_from_coordinates, move_to_folder, get_creation_time, 
-                   check_internet_connection)
+from constants import (SUPPORTED_MEDIA_FORMATS, STATE_MAPPING, 
+                       COUNTRY_CODES, EXTRACTION_WORKERS, PENDING_FOLDER, LOCATION_FOLDER_DEPTH,
+                       PREFETCH_BATCH_SIZE)
+from utils import PlaceLookups, place_folder, safe_folder_name
+from move_plan import MovePlan, run_moves, remove_empty_folders
+from move_journal import MoveJournal, open_journal, load_journal, complete_undo
+from boundary_resolver import get_boundaries, COUNTRY
+from offline_geocoder import get_gazetteer
+from metadata_cache import open_metadata_cache
+from geocode_cache import open_geocode_cache
+from geofences import load_geofences
+from media_record import iter_media_records
+from location_clusters import ClusterIndex, cluster_points
+from file_scanner import scan_paths
 from PyQt5.QtCore import QThread, pyqtSignal
-import requests
-import shutil
-import time
+from concurrent.futures import wait
 import re
 import os
 
@@ -14,76 +21,29 @@ class MapGenerationThread(QThread):
     update_progress = pyqtSignal(int)
     update_output = pyqtSignal(str)
     finished = pyqtSignal(list, list, str, str)
-    internet_check_failed = pyqtSignal()
 
-    def __init__(self, folder_path, us_svg_path, world_svg_path):
+    def __init__(self, folder_path, us_svg_path, world_svg_path, exiftool_pool=None,
+                 extraction_workers=EXTRACTION_WORKERS):
         super().__init__()
         self.folder_path = folder_path
         self.us_svg_path = us_svg_path
         self.world_svg_path = world_svg_path
-        self.state_cache = {}
-        self.country_cache = {}
-
-    def normalize_country_name(self, country):
-        """Normalize country names to English"""
-        return COUNTRY_MAPPING.get(country, country)
-    
-    def get_location_details(self, lat, lon):
-        """Get both country and state information for coordinates"""
-        cache_key = f"{lat},{lon}"
-        
-        if cache_key in self.state_cache:
-            return self.state_cache[cache_key]
-            
-        base_url = "https://nominatim.openstreetmap.org/reverse"
-        params = {
-            "lat": lat,
-            "lon": lon,
-            "format": "json"
-        }
-        headers = {
-            "User-Agent": "Media GPS Extractor/1.0"
-        }
-        
-        try:
-            response = requests.get(base_url, params=params, headers=headers)
-            if response.status_code == 200:
-                data = response.json()
-                address = data.get('address', {})
-                country = self.normalize_country_name(address.get('country', 'Unknown'))
-                state = None
-                
-                if address.get('country_code', '').upper() == 'US':
-                    state = address.get('state', None)
-                    country = "United States"
-                
-                result = {'country': country, 'state': state}
-                self.state_cache[cache_key] = result
-                return result
-            else:
-                return None
-        except Exception as e:
-            self.update_output.emit(f"Error fetching location: {str(e)}")
-            return None
-        
+        self.exiftool_pool = exiftool_pool
+        self.extraction_workers = extraction_workers
+        self.geocode_cache = None
+
     def get_all_files(self):
-        """Get all files from the specified folder"""
-        all_files = []
-        for file in os.listdir(self.folder_path):
-            file_path = os.path.join(self.folder_path, file)
-            if os.path.isfile(file_path):
-                all_files.append(file_path)
-        return all_files
-
-    def update_svg_maps(self, us_states, world_countries):
+        """Get the media files in the specified folder; only they can hold a location"""
+        return list(scan_paths(self.folder_path, extensions=SUPPORTED_MEDIA_FORMATS, max_depth=0))
+
+    def update_svg_maps(self, state_codes, country_codes):
         # Update United States map
         us_svg = None
         if os.path.exists(self.us_svg_path):
             try:
                 with open(self.us_svg_path, 'r', encoding='utf-8') as f:
                     us_svg = f.read()
-                    for state in us_states:
-                        state_abbr = self.get_state_abbreviation(state)
+                    for state_abbr in state_codes:
                         if state_abbr:
                             pattern = f'(<path[^>]*id="{state_abbr}"[^>]*style=")[^"]*(")'
                             replacement = r'\1stroke-width:0.97063118000000004;fill:#2ecc71\2'
@@ -99,8 +59,7 @@ class MapGenerationThread(QThread):
                 with open(self.world_svg_path, 'r', encoding='utf-8') as f:
                     world_svg = f.read()
                     
-                    for country in world_countries:
-                        country_code = self.get_country_code(country)
+                    for country_code in country_codes:
                         if country_code:
                                 id_pattern = f'(<path[^>]*id="{country_code}"[^>]*)'
                                 if re.search(id_pattern, world_svg):
@@ -121,60 +80,69 @@ class MapGenerationThread(QThread):
         """Convert state name to abbreviation"""
         return STATE_MAPPING.get(state_name)
 
-    def get_country_code(self, country_name):
-        """Convert country name to code used in SVG"""
-        return COUNTRY_CODES.get(country_name, country_name)
-    
+    def get_state_name(self, state_code):
+        """Convert state abbreviation back to its name"""
+        return next((name for name, code in STATE_MAPPING.items() if code == state_code), state_code)
+
+    def get_country_name(self, country_code):
+        """Convert SVG country code back to its name"""
+        name = next((name for name, code in COUNTRY_CODES.items() if code == country_code), None)
+        if name is None and get_boundaries() is not None:
+            name = get_boundaries().names.get((COUNTRY, country_code))
+        if name is None and get_gazetteer() is not None:
+            name = get_gazetteer().country_names.get(country_code)
+        return name or country_code
+
+    def resolve_places(self, points):
+        """Resolve one Place per cluster of nearby points; online answers are usually cached by a sort"""
+        lookups = PlaceLookups(self.geocode_cache)
+        for cluster_index, cluster in enumerate(cluster_points(points)):
+            lookups.start(cluster_index, *cluster.center)
+        places = lookups.results()
+        if lookups.failed:
+            self.update_output.emit(f"Could not look up {len(lookups.failed)} places; "
+                                    f"they will be retried next time")
+        return [place for place in places.values() if place]
+
+    def aggregate_regions(self, places):
+        """Return the sets of US state and country codes the places lie in"""
+        state_codes = set()
+        country_codes = set()
+        for place in places:
+            state_code = self.get_state_abbreviation(place.state) if place.country_code == 'US' else None
+            if state_code and state_code not in state_codes:
+                state_codes.add(state_code)
+                self.update_output.emit(f"Found location in {self.get_state_name(state_code)}, United States")
+            if place.country_code and place.country_code not in country_codes:
+                country_codes.add(place.country_code)
+                if not state_code:
+                    self.update_output.emit(f"Found location in {self.get_country_name(place.country_code)}")
+        return state_codes, country_codes
+
     def run(self):
+        cache = None
         try:
             all_files = self.get_all_files()
             total_files = len(all_files)
-            us_states = set()
-            world_countries = set()
-
             if total_files == 0:
                 self.finished.emit([], [], "", "")
                 return
 
-            self.update_output.emit("Checking internet connection...")
-            time.sleep(0.5)
-            
-            if not check_internet_connection():
-                self.update_output.emit("Error: No internet connection. Map generation requires internet access.")
-                self.internet_check_failed.emit()
-                return
-
-            for index, file_path in enumerate(all_files, 1):
-                try:
-                    file_extension = os.path.splitext(file_path)[1].lower()
-                    coordinates = None
-
-                    if file_extension in IMAGE_FORMATS:
-                        coordinates = extract_gps_info_image(file_path)
-                    elif file_extension in VIDEO_FORMATS:
-                        coordinates = extract_gps_info_video(file_path)
-
-                    if coordinates:
-                        lat, lon = coordinates
-                        location = self.get_location_details(lat, lon)
-                        if location:
-                            country = location['country']
-                            if location['state']:
-                                us_states.add(location['state'])
-                                world_countries.add('United States')
-                                self.update_output.emit(f"Found location in {location['state']}, United States")
-                            else:
-                                world_countries.add(country)
-                                self.update_output.emit(f"Found location in {country}")
-                    
-                    progress = int((index / total_files) * 100)
-                    self.update_progress.emit(progress)
-                    
-                except Exception as e:
-                    self.update_output.emit(f"Error processing file: {str(e)}")
-
-            us_states_list = sorted(list(us_states))
-            world_countries_list = sorted(list(world_countries))
+            cache = open_metadata_cache()
+            self.geocode_cache = open_geocode_cache()
+            records = iter_media_records(all_files, self.exiftool_pool, self.extraction_workers, cache=cache)
+            points = []
+            for index, record in enumerate(records, 1):
+                if record.gps:
+                    points.append(record.gps)
+                progress = int((index / total_files) * 100)
+                self.update_progress.emit(progress)
+
+            state_codes, country_codes = self.aggregate_regions(self.resolve_places(points))
+            if self.geocode_cache and self.geocode_cache.hits + self.geocode_cache.misses:
+                self.update_output.emit(self.geocode_cache.stats_message())
+            us_states_list = sorted(self.get_state_name(code) for code in state_codes)
+            world_countries_list = sorted(self.get_country_name(code) for code in country_codes)
 
             if not us_states_list and not world_countries_list:
                 self.finished.emit([], [], "", "")
@@ -190,119 +158,225 @@ class MapGenerationThread(QThread):
                 for country in world_countries_list:
                     self.update_output.emit(f"- {country}")
 
-            us_svg, world_svg = self.update_svg_maps(us_states_list, world_countries_list)
+            us_svg, world_svg = self.update_svg_maps(state_codes, country_codes)
             self.finished.emit(us_states_list, world_countries_list, us_svg, world_svg)
 
         except Exception as e:
             self.update_output.emit(f"Error during map generation: {str(e)}")
             self.finished.emit([], [], "", "")
+        finally:
+            if cache:
+                cache.close()
+            if self.geocode_cache:
+                self.geocode_cache.close()
             
 class SortByLocThread(QThread):
     update_progress = pyqtSignal(int)
     update_output = pyqtSignal(str)
     finished = pyqtSignal()
     file_processed = pyqtSignal()
-    internet_check_failed = pyqtSignal()
 
-    def __init__(self, folder_path, is_additional_sort=False):
+    def __init__(self, folder_path, is_additional_sort=False, exiftool_pool=None,
+                 extraction_workers=EXTRACTION_WORKERS, folder_depth=LOCATION_FOLDER_DEPTH):
         super().__init__()
         self.folder_path = folder_path
         self.is_additional_sort = is_additional_sort
+        self.exiftool_pool = exiftool_pool
+        self.extraction_workers = extraction_workers
+        self.folder_depth = folder_depth
+        self.geocode_cache = None
+        self.geofences = None
+        self.plan = None
+        self.journal = None
 
     def get_all_files(self):
-        all_files = []
-        try:
-            if self.is_additional_sort:
-                # For additional sorting, process files in all immediate subdirectories
-                for item in os.listdir(self.folder_path):
-                    item_path = os.path.join(self.folder_path, item)
-                    if os.path.isdir(item_path):
-                        for file in os.listdir(item_path):
-                            file_path = os.path.join(item_path, file)
-                            if os.path.isfile(file_path):
-                                all_files.append(file_path)
-            else:
-                # For initial sorting, only process files in the selected directory
-                for file in os.listdir(self.folder_path):
-                    file_path = os.path.join(self.folder_path, file)
-                    if os.path.isfile(file_path):
-                        all_files.append(file_path)
-        except Exception as e:
-            self.update_output.emit(f"Error accessing directory: {str(e)}")
-        return all_files
+        # An additional sort takes the files in the immediate subdirectories, an initial one the folder's own.
+        # Parked files are picked up from the pending queue instead
+        depth = 1 if self.is_additional_sort else 0
+        return list(scan_paths(self.folder_path, min_depth=depth, max_depth=depth, skip_dirs=(PENDING_FOLDER,),
+                               onerror=self._report_scan_error))
+
+    def _report_scan_error(self, error):
+        self.update_output.emit(f"Error accessing directory: {str(error)}")
 
     def run(self):
+        cache = None
         try:
             unsupported_formats = set()
+            self.geofences = load_geofences()
+            self.geocode_cache = open_geocode_cache()
+            self.journal = open_journal('location_sort', self.folder_path)
+            if self.geocode_cache:
+                self.drain_pending()
+
             all_files = self.get_all_files()
             total_files = len(all_files)
 
             if total_files == 0:
+                if self.journal:
+                    self.journal.finish()
                 self.update_output.emit("No files found to sort")
                 self.update_output.emit("Location sorting completed")
                 self.finished.emit()
                 return
 
-            self.update_output.emit("Checking internet connection...")
-            time.sleep(0.5)  # Small delay to ensure message is visible
-            
-            if not check_internet_connection():
-                self.update_output.emit("Error: No internet connection. Location sorting requires internet access.")
-                self.internet_check_failed.emit()
-                self.finished.emit()
-                return
-
-            for index, file_path in enumerate(all_files, 1):
-                try:
-                    file_name = os.path.basename(file_path)
-                    file_extension = os.path.splitext(file_path)[1].lower()
-
-                    if file_extension in SUPPORTED_MEDIA_FORMATS:
-                        self.process_media(file_path, file_name, index, total_files)
-                        self.file_processed.emit()
-                    else:
-                        self.update_output.emit(f"Moved {file_name} to Not Supported ({index}/{total_files})")
-                        move_to_folder(file_path, 'Not Supported')
-                        unsupported_formats.add(file_extension)
-                        self.file_processed.emit()
-
-                    progress = int((index / total_files) * 100)
-                    self.update_progress.emit(progress)
-                except Exception as e:
-                    self.update_output.emit(f"Error processing {file_name}: {str(e)}")
+            cache = open_metadata_cache()
+            # Geofences name their photos outright; nearby photos elsewhere share one lookup,
+            # which runs in the background while later files are read
+            records = []
+            folders = {}
+            clusters = ClusterIndex()
+            record_clusters = {}
+            lookups = PlaceLookups(self.geocode_cache)
+            for index, record in enumerate(iter_media_records(all_files, self.exiftool_pool,
+                                                              self.extraction_workers, cache=cache), 1):
+                records.append(record)
+                fence = self.geofences.match(*record.gps) if record.gps and self.geofences else None
+                if fence:
+                    folders[record.path] = safe_folder_name(fence)
+                elif record.gps:
+                    cluster_index, is_new = clusters.add(*record.gps)
+                    record_clusters[record.path] = cluster_index
+                    if is_new:
+                        lookups.start(cluster_index, *record.gps)
+                self.update_progress.emit(int((index / total_files) * 50))
+
+            if folders:
+                self.update_output.emit(f"{len(folders)} files are inside your geofences")
+            if record_clusters:
+                self.update_output.emit(f"Resolving {len(record_clusters)} locations "
+                                        f"from {len(clusters.clusters)} places...")
+            places = lookups.results()
+            gps_by_path = {record.path: record.gps for record in records if record.gps}
+            for path, cluster_index in record_clusters.items():
+                if cluster_index in lookups.failed and self.geocode_cache:
+                    folders[path] = PENDING_FOLDER
+                else:
+                    folders[path] = place_folder(places[cluster_index], self.folder_depth)
+
+            self.plan = self.plan_moves(records, folders, unsupported_formats)
+            self.update_output.emit(f"Moving {len(self.plan)} files into {len(self.plan.folders())} folders")
+            # Parked files are queued before they move, so a resumed sort needs no geocoding for them
+            parked = [(move.target, os.path.dirname(move.source), *gps_by_path[move.source])
+                      for move in self.plan if os.path.basename(move.folder) == PENDING_FOLDER]
+            if parked:
+                self.geocode_cache.queue_pending(parked)
+            failed = []
+            for index, (move, error) in enumerate(self.plan.execute(self.journal), 1):
+                file_name = os.path.basename(move.source)
+                folder_name = os.path.relpath(move.folder, os.path.dirname(move.source))
+                if error:
+                    failed.append(move.target)
+                    self.update_output.emit(f"Error processing {file_name}: {str(error)}")
+                elif folder_name == PENDING_FOLDER:
+                    self.update_output.emit(f"Moved {file_name} to {PENDING_FOLDER} until its location "
+                                            f"can be looked up ({index}/{total_files})")
+                    self.file_processed.emit()
+                else:
+                    renamed = f" as {move.name}" if move.name != file_name else ""
+                    self.update_output.emit(f"Moved {file_name} to {folder_name}{renamed} ({index}/{total_files})")
+                    self.file_processed.emit()
+                self.update_progress.emit(50 + int((index / total_files) * 50))
+            if parked and failed:
+                self.geocode_cache.remove_pending(failed)
 
             if unsupported_formats:
                 unsupported_str = "\nUnsupported file formats encountered:\n"
                 unsupported_str += "\n".join([f"- {format}" for format in unsupported_formats])
                 self.update_output.emit(unsupported_str)
 
+            if self.journal:
+                self.journal.finish()
+            self._report_geocode_cache()
             self.update_output.emit("Location sorting completed")
 
         except Exception as e:
             self.update_output.emit(f"Error during sorting: {str(e)}")
         finally:
+            if cache:
+                cache.close()
+            if self.geocode_cache:
+                self.geocode_cache.close()
+            if self.journal:
+                self.journal.close()
             self.finished.emit()
 
-    def process_media(self, file_path, file_name, index, total_files):
-        file_extension = os.path.splitext(file_path)[1].lower()
-        
-        if file_extension in IMAGE_FORMATS:
-            coordinates = extract_gps_info_image(file_path)
-        elif file_extension in VIDEO_FORMATS:
-            coordinates = extract_gps_info_video(file_path)
+    def _report_geocode_cache(self):
+        if self.geocode_cache and self.geocode_cache.hits + self.geocode_cache.misses:
+            self.update_output.emit(self.geocode_cache.stats_message())
+
+    def plan_moves(self, records, folders, unsupported_formats):
+        """Plan every file's move into its place, the staging folder, Unknown or Not Supported"""
+        plan = MovePlan()
+        for record in records:
+            base_dir = os.path.dirname(record.path)
+            file_extension = os.path.splitext(record.path)[1].lower()
+            if file_extension in SUPPORTED_MEDIA_FORMATS:
+                plan.add(record.path, os.path.join(base_dir, folders.get(record.path) or 'Unknown'), keep_both=True)
+            else:
+                plan.add(record.path, os.path.join(base_dir, 'Not Supported'), keep_both=True)
+                unsupported_formats.add(file_extension)
+        return plan
+
+    def drain_pending(self):
+        """Sort files parked by earlier runs now that their locations may be reachable"""
+        if self.is_additional_sort:
+            folders = [os.path.join(self.folder_path, item) for item in os.listdir(self.folder_path)
+                       if os.path.isdir(os.path.join(self.folder_path, item)) and item != PENDING_FOLDER]
         else:
-            move_to_folder(file_path, 'Not Supported')
-            self.update_output.emit(f"Moved {file_name} to Not Supported ({index}/{total_files})")
+            folders = [self.folder_path]
+        entries = [(folder, path, lat, lon) for folder in folders
+                   for path, lat, lon in self.geocode_cache.pending_in(folder)]
+        if not entries:
             return
 
-        if coordinates:
-            lat, lon = coordinates
-            city = get_location_from_coordinates(lat, lon)
-            move_to_folder(file_path, city)
-            self.update_output.emit(f"Moved {file_name} to {city} ({index}/{total_files})")
-        else:
-            move_to_folder(file_path, 'Unknown')
-            self.update_output.emit(f"Moved {file_name} to Unknown ({index}/{total_files})")
+        self.update_output.emit(f"Retrying {len(entries)} files waiting for a location...")
+        # Files the user moved or deleted since are simply forgotten
+        missing = [path for _, path, _, _ in entries if not os.path.exists(path)]
+        entries = [entry for entry in entries if os.path.exists(entry[1])]
+        clusters = ClusterIndex()
+        lookups = PlaceLookups(self.geocode_cache)
+        fenced = {}
+        entry_clusters = []
+        for _, path, lat, lon in entries:
+            # A geofence added since the file was parked names it without a lookup
+            fence = self.geofences.match(lat, lon) if self.geofences else None
+            if fence:
+                fenced[path] = safe_folder_name(fence)
+                entry_clusters.append(None)
+                continue
+            cluster_index, is_new = clusters.add(lat, lon)
+            entry_clusters.append(cluster_index)
+            if is_new:
+                lookups.start(cluster_index, lat, lon)
+
+        places = lookups.results()
+        plan = MovePlan()
+        for (folder, path, _, _), cluster_index in zip(entries, entry_clusters):
+            if path in fenced:
+                plan.add(path, os.path.join(folder, fenced[path]), keep_both=True)
+            elif cluster_index not in lookups.failed:
+                plan.add(path, os.path.join(folder, place_folder(places[cluster_index], self.folder_depth)),
+                         keep_both=True)
+        moved = []
+        for move, error in plan.execute(self.journal):
+            file_name = os.path.basename(move.source)
+            if error:
+                self.update_output.emit(f"Error processing {file_name}: {str(error)}")
+                continue
+            moved.append(move.source)
+            place_path = os.path.relpath(move.folder, os.path.dirname(os.path.dirname(move.source)))
+            renamed = f" as {move.name}" if move.name != file_name else ""
+            self.update_output.emit(f"Moved {file_name} from {PENDING_FOLDER} to {place_path}{renamed}")
+        self.geocode_cache.remove_pending(missing + moved)
+        for folder in folders:
+            try:
+                os.rmdir(os.path.join(folder, PENDING_FOLDER))
+            except OSError:
+                pass  # Missing, or still holding files
+
+        if len(moved) < len(entries):
+            self.update_output.emit(f"{len(entries) - len(moved)} files are still waiting for a location")
 
 class FlattenFolderThread(QThread):
     update_progress = pyqtSignal(int)
@@ -312,28 +386,22 @@ class FlattenFolderThread(QThread):
     def __init__(self, folder_path):
         super().__init__()
         self.folder_path = folder_path
+        self.plan = None
+        self.journal = None
 
     def get_all_files(self):
-        all_files = []
-        for root, _, files in os.walk(self.folder_path):
-            if root == self.folder_path:  # Skip files already in root folder
-                continue
-            for file in files:
-                file_path = os.path.join(root, file)
-                all_files.append(file_path)
-        return all_files
-
-    def get_unique_filename(self, dest_folder, filename):
-        """Generate a unique filename if the file already exists."""
-        base_name, ext = os.path.splitext(filename)
-        counter = 1
-        new_filename = filename
-        
-        while os.path.exists(os.path.join(dest_folder, new_filename)):
-            new_filename = f"{base_name} ({counter}){ext}"
-            counter += 1
-            
-        return new_filename
+        # Files already in the root folder stay put
+        return list(scan_paths(self.folder_path, min_depth=1, onerror=self._report_scan_error))
+
+    def _report_scan_error(self, error):
+        self.update_output.emit(f"Error accessing directory: {str(error)}")
+
+    def plan_moves(self, all_files):
+        """Plan every file's move into the root folder; names that clash there get a numbered suffix"""
+        plan = MovePlan()
+        for src_path in all_files:
+            plan.add(src_path, self.folder_path, keep_both=True)
+        return plan
 
     def run(self):
         try:
@@ -345,41 +413,38 @@ class FlattenFolderThread(QThread):
                 self.finished.emit()
                 return
             
-            for index, src_path in enumerate(all_files, 1):
-                try:
-                    file_name = os.path.basename(src_path)
-                    # Generate unique filename
-                    unique_name = self.get_unique_filename(self.folder_path, file_name)
-                    dest_path = os.path.join(self.folder_path, unique_name)
-                    
-                    shutil.move(src_path, dest_path)
-                    
-                    progress = int((index / total_files) * 100)
-                    self.update_progress.emit(progress)
+            self.plan = self.plan_moves(all_files)
+            self.journal = open_journal('flatten', self.folder_path)
+            for index, (move, error) in enumerate(self.plan.execute(self.journal), 1):
+                file_name = os.path.basename(move.source)
+                if error:
+                    self.update_output.emit(f"Error moving {file_name}: {str(error)}")
+                elif file_name != move.name:
+                    self.update_output.emit(f"Moved: {file_name} → {move.name} ({index}/{total_files})")
+                else:
+                    self.update_output.emit(f"Moved: {file_name} ({index}/{total_files})")
+                self.update_progress.emit(int((index / total_files) * 100))
                     
-                    if file_name != unique_name:
-                        self.update_output.emit(f"Moved: {file_name} → {unique_name} ({index}/{total_files})")
-                    else:
-                        self.update_output.emit(f"Moved: {file_name} ({index}/{total_files})")
-                        
-                except Exception as e:
-                    self.update_output.emit(f"Error moving {file_name}: {str(e)}")
-                    
-            # Clean up empty directories
-            for root, dirs, files in os.walk(self.folder_path, topdown=False):
-                for dir_name in dirs:
-                    dir_path = os.path.join(root, dir_name)
-                    try:
-                        if not os.listdir(dir_path):
-                            os.rmdir(dir_path)
-                    except Exception as e:
-                        self.update_output.emit(f"Error removing empty directory {dir_name}: {str(e)}")
+            # Clean up empty directories; undo puts them back
+            removed = []
+            for dir_path, error in remove_empty_folders(self.folder_path):
+                if error:
+                    self.update_output.emit(f"Error removing empty directory {os.path.basename(dir_path)}: "
+                                            f"{str(error)}")
+                else:
+                    removed.append(dir_path)
+            if self.journal:
+                if removed:
+                    self.journal.record_folders(removed=removed)
+                self.journal.finish()
             
             self.update_output.emit("\nFolder flattening completed")
 
         except Exception as e:
             self.update_output.emit(f"Error during flattening: {str(e)}")
         finally:
+            if self.journal:
+                self.journal.close()
             self.finished.emit()
 
 class SortByTimeThread(QThread):
@@ -388,31 +453,36 @@ class SortByTimeThread(QThread):
     finished = pyqtSignal()
     file_processed = pyqtSignal()
 
-    def __init__(self, folder_path, is_additional_sort=False):
+    def __init__(self, folder_path, is_additional_sort=False, exiftool_pool=None,
+                 extraction_workers=EXTRACTION_WORKERS):
         super().__init__()
         self.folder_path = folder_path
         self.is_additional_sort = is_additional_sort
+        self.exiftool_pool = exiftool_pool
+        self.extraction_workers = extraction_workers
+        self.plan = None
+        self.journal = None
 
     def get_all_files(self):
-        all_files = []
-        if self.is_additional_sort:
-            # For additional sorting, process files in all immediate subdirectories
-            for item in os.listdir(self.folder_path):
-                item_path = os.path.join(self.folder_path, item)
-                if os.path.isdir(item_path):
-                    for file in os.listdir(item_path):
-                        file_path = os.path.join(item_path, file)
-                        if os.path.isfile(file_path):
-                            all_files.append(file_path)
-        else:
-            # For initial sorting, only process files in the selected directory
-            for file in os.listdir(self.folder_path):
-                file_path = os.path.join(self.folder_path, file)
-                if os.path.isfile(file_path):
-                    all_files.append(file_path)
-        return all_files
+        # An additional sort takes the files in the immediate subdirectories, an initial one the folder's own
+        depth = 1 if self.is_additional_sort else 0
+        return list(scan_paths(self.folder_path, min_depth=depth, max_depth=depth))
+
+    def plan_moves(self, records, total_files):
+        """Plan every file's move into a month folder beside it, or in the root for a first sort"""
+        plan = MovePlan()
+        for index, record in enumerate(records, 1):
+            if record.capture_time is None:
+                self.update_output.emit(f"Error processing {os.path.basename(record.path)}: no date found")
+                continue
+            year_month = record.capture_time.strftime("%b, %y")
+            base_dir = os.path.dirname(record.path) if self.is_additional_sort else self.folder_path
+            plan.add(record.path, os.path.join(base_dir, year_month), keep_both=True)
+            self.update_progress.emit(int((index / total_files) * 50))
+        return plan
 
     def run(self):
+        cache = None
         try:
             all_files = self.get_all_files()
             total_files = len(all_files)
@@ -423,31 +493,23 @@ class SortByTimeThread(QThread):
                 self.finished.emit()
                 return
 
-            for index, file_path in enumerate(all_files, 1):
-                try:
-                    file_name = os.path.basename(file_path)
-                    date = get_creation_time(file_path)
-                    year_month = date.strftime("%b, %y")
-                    
-                    if self.is_additional_sort:
-                        parent_folder = os.path.dirname(file_path)
-                        new_folder = os.path.join(parent_folder, year_month)
-                    else:
-                        new_folder = os.path.join(self.folder_path, year_month)
-                    
-                    if not os.path.exists(new_folder):
-                        os.makedirs(new_folder)
-                    
-                    new_file_path = os.path.join(new_folder, file_name)
-                    shutil.move(file_path, new_file_path)
-                    
-                    progress = int((index / total_files) * 100)
-                    self.update_progress.emit(progress)
-                    self.update_output.emit(f"Moved {file_name} to {year_month} ({index}/{total_files})")
+            cache = open_metadata_cache()
+            records = iter_media_records(all_files, self.exiftool_pool, self.extraction_workers, cache=cache)
+            self.plan = self.plan_moves(records, total_files)
+            self.update_output.emit(f"Moving {len(self.plan)} files into {len(self.plan.folders())} folders")
+            self.journal = open_journal('time_sort', self.folder_path)
+            for index, (move, error) in enumerate(self.plan.execute(self.journal), 1):
+                file_name = os.path.basename(move.source)
+                if error:
+                    self.update_output.emit(f"Error processing {file_name}: {str(error)}")
+                else:
+                    renamed = f" as {move.name}" if move.name != file_name else ""
+                    self.update_output.emit(f"Moved {file_name} to {os.path.basename(move.folder)}{renamed} "
+                                            f"({index}/{len(self.plan)})")
                     self.file_processed.emit()
-                    
-                except Exception as e:
-                    self.update_output.emit(f"Error processing {file_name}: {str(e)}")
+                self.update_progress.emit(50 + int((index / len(self.plan)) * 50))
+            if self.journal:
+                self.journal.finish()
 
             if total_files > 0:
                 self.update_output.emit("Time sorting completed")
@@ -455,4 +517,187 @@ class SortByTimeThread(QThread):
         except Exception as e:
             self.update_output.emit(f"Error during sorting: {str(e)}")
         finally:
-            self.finished.emit()
\ No newline at end of file
+            if cache:
+                cache.close()
+            if self.journal:
+                self.journal.close()
+            self.finished.emit()
+
+
+class PrefetchThread(QThread):
+    """Reads a newly picked folder's metadata and places so the next operation finds them cached.
+
+    Run it at idle priority. requestInterruption() stops it after the current
+    batch of files; wait() returns once both caches have been written.
+    """
+
+    def __init__(self, folder_path, exiftool_pool=None):
+        super().__init__()
+        self.folder_path = folder_path
+        self.exiftool_pool = exiftool_pool
+
+    def get_all_files(self):
+        """Stream the folder's own media files, then those in its subfolders, as an additional sort reads them"""
+        return scan_paths(self.folder_path, extensions=SUPPORTED_MEDIA_FORMATS, max_depth=1,
+                          skip_dirs=(PENDING_FOLDER,), onerror=lambda e: print(f"Error accessing directory: {e}"),
+                          should_stop=self.isInterruptionRequested)
+
+    def run(self):
+        cache = None
+        geocode_cache = None
+        lookups = None
+        records = None
+        try:
+            if self.isInterruptionRequested():
+                return
+
+            cache = open_metadata_cache()
+            geocode_cache = open_geocode_cache()
+            geofences = load_geofences()
+            clusters = ClusterIndex()
+            lookups = PlaceLookups(geocode_cache)
+            # Files are read as the scan finds them, one small batch at a time in this thread,
+            # so a real operation never waits long for it to stop
+            records = iter_media_records(self.get_all_files(), self.exiftool_pool, 1, PREFETCH_BATCH_SIZE,
+                                         cache=cache)
+            for record in records:
+                if self.isInterruptionRequested():
+                    return
+                if record.gps and not (geofences and geofences.match(*record.gps)):
+                    cluster_index, is_new = clusters.add(*record.gps)
+                    if is_new:
+                        lookups.start(cluster_index, *record.gps)
+
+            lookups.flush()
+            futures = [future for _, _, future in lookups.pending.values()]
+            while futures and wait(futures, timeout=0.25).not_done:
+                if self.isInterruptionRequested():
+                    return
+            lookups.results()
+        except Exception as e:
+            print(f"Error during prefetch: {e}")
+        finally:
+            if records is not None:
+                records.close()
+            if lookups is not None:
+                lookups.cancel()
+            if cache:
+                cache.close()
+            if geocode_cache:
+                geocode_cache.close()
+
+class ResumeMovesThread(QThread):
+    """Finishes the moves of an operation that a crash stopped partway, from its journal.
+
+    The journal holds the whole plan, so nothing is read or looked up again.
+    """
+    update_progress = pyqtSignal(int)
+    update_output = pyqtSignal(str)
+    finished = pyqtSignal()
+
+    def __init__(self, journal_state):
+        super().__init__()
+        self.journal_state = journal_state
+
+    def run(self):
+        state = self.journal_state
+        journal = None
+        try:
+            journal = MoveJournal(state.path)
+            remaining = []
+            for index, move in state.remaining():
+                if not os.path.exists(move.source) and os.path.exists(move.target):
+                    # Moved just before the crash, after the journal was last synced
+                    journal.mark_done(index)
+                else:
+                    remaining.append((index, move))
+
+            total_moves = len(remaining)
+            self.update_output.emit(f"Resuming {state.label.lower()} of {state.folder}: "
+                                    f"{total_moves} of {len(state.moves)} files left to move")
+            for index, (move, error) in enumerate(run_moves(remaining, journal), 1):
+                file_name = os.path.basename(move.source)
+                if error:
+                    self.update_output.emit(f"Error moving {file_name}: {str(error)}")
+                else:
+                    self.update_output.emit(f"Moved {file_name} to {os.path.relpath(move.target, state.folder)} "
+                                            f"({index}/{total_moves})")
+                self.update_progress.emit(int((index / total_moves) * 100))
+
+            if state.operation == 'flatten':
+                removed = []
+                for dir_path, error in remove_empty_folders(state.folder):
+                    if error:
+                        self.update_output.emit(f"Error removing empty directory {os.path.basename(dir_path)}: "
+                                                f"{str(error)}")
+                    else:
+                        removed.append(dir_path)
+                if removed:
+                    journal.record_folders(removed=removed)
+            elif state.operation == 'undo' and state.undoes and os.path.exists(state.undoes):
+                complete_undo(load_journal(state.undoes))
+            journal.finish()
+            self.update_output.emit(f"\n{state.label} completed")
+
+        except Exception as e:
+            self.update_output.emit(f"Error while resuming: {str(e)}")
+        finally:
+            if journal:
+                journal.close()
+            self.finished.emit()
+
+class UndoThread(QThread):
+    """Moves the files of a journaled operation back where they were, newest move first.
+
+    Each file is renamed straight back from the journal, so nothing is
+    scanned or hashed. Folders the operation created are removed once empty.
+    A file whose original path has been taken since is left where it is.
+    """
+    update_progress = pyqtSignal(int)
+    update_output = pyqtSignal(str)
+    finished = pyqtSignal()
+
+    def __init__(self, journal_state):
+        super().__init__()
+        self.journal_state = journal_state
+        self.plan = None
+        self.journal = None
+
+    def plan_moves(self):
+        plan = MovePlan()
+        for move in reversed(self.journal_state.done_moves()):
+            if os.path.lexists(move.source):
+                self.update_output.emit(f"Skipped {os.path.basename(move.source)}: "
+                                        f"a file is already at its original path")
+                continue
+            plan.add(move.target, os.path.dirname(move.source), name=os.path.basename(move.source))
+        return plan
+
+    def run(self):
+        state = self.journal_state
+        try:
+            self.plan = self.plan_moves()
+            total_moves = len(self.plan)
+            self.update_output.emit(f"Undoing {state.label.lower()} of {state.folder}: "
+                                    f"moving {total_moves} files back")
+            self.journal = open_journal('undo', state.folder, state.path)
+            for index, (move, error) in enumerate(self.plan.execute(self.journal), 1):
+                file_name = os.path.basename(move.source)
+                if error:
+                    self.update_output.emit(f"Error moving {file_name} back: {str(error)}")
+                else:
+                    self.update_output.emit(f"Moved {file_name} back to "
+                                            f"{os.path.relpath(move.target, state.folder)} ({index}/{total_moves})")
+                self.update_progress.emit(int((index / total_moves) * 100))
+
+            complete_undo(state)
+            if self.journal:
+                self.journal.finish()
+            self.update_output.emit(f"\n{state.label} undone")
+
+        except Exception as e:
+            self.update_output.emit(f"Error during undo: {str(e)}")
+        finally:
+            if self.journal:
+                self.journal.close()
+            self.finished.emit()